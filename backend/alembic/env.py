@@ -8,6 +8,7 @@ from app.models.session import Session
 from app.models.message import Message
 from app.models.file import File
 from app.models.moment import Moment, MomentLike, MomentComment
+from app.models.list_version import ListVersion
 
 # 确保所有模型都被SQLAlchemy发现
 # 导入后不需要其他操作，Base.metadata会自动包含它们
@@ -0,0 +1,23 @@
+"""add moments.updated_at index for feed etags
+
+Revision ID: 0b9e2f4c7a13
+Revises: f1a6d3b8c470
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "0b9e2f4c7a13"
+down_revision = "f1a6d3b8c470"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_moments_updated_at", "moments", ["updated_at"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_moments_updated_at", table_name="moments")
@@ -0,0 +1,29 @@
+"""add (moment_id, created_at) indexes on moment likes and comments
+
+Revision ID: 3c8d5e1f9a24
+Revises: 0b9e2f4c7a13
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "3c8d5e1f9a24"
+down_revision = "0b9e2f4c7a13"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_moment_likes_moment_id_created_at", "moment_likes", ["moment_id", "created_at"], unique=False
+    )
+    op.create_index(
+        "ix_moment_comments_moment_id_created_at", "moment_comments", ["moment_id", "created_at"], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_moment_comments_moment_id_created_at", table_name="moment_comments")
+    op.drop_index("ix_moment_likes_moment_id_created_at", table_name="moment_likes")
@@ -0,0 +1,48 @@
+"""add moments like_count / comment_count with backfill
+
+Revision ID: 5d7f0a2b6e38
+Revises: 3c8d5e1f9a24
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "5d7f0a2b6e38"
+down_revision = "3c8d5e1f9a24"
+branch_labels = None
+depends_on = None
+
+moments_table = sa.table(
+    "moments",
+    sa.column("id", sa.String()),
+    sa.column("like_count", sa.Integer()),
+    sa.column("comment_count", sa.Integer()),
+)
+likes_table = sa.table("moment_likes", sa.column("moment_id", sa.String()))
+comments_table = sa.table("moment_comments", sa.column("moment_id", sa.String()))
+
+
+def upgrade() -> None:
+    op.add_column("moments", sa.Column("like_count", sa.Integer(), nullable=False, server_default="0"))
+    op.add_column("moments", sa.Column("comment_count", sa.Integer(), nullable=False, server_default="0"))
+
+    # 关联子查询回填，走 (moment_id, created_at) 索引
+    op.execute(
+        moments_table.update().values(
+            like_count=sa.select(sa.func.count())
+            .where(likes_table.c.moment_id == moments_table.c.id)
+            .scalar_subquery(),
+            comment_count=sa.select(sa.func.count())
+            .where(comments_table.c.moment_id == moments_table.c.id)
+            .scalar_subquery(),
+        )
+    )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("moments") as batch_op:
+        batch_op.drop_column("comment_count")
+        batch_op.drop_column("like_count")
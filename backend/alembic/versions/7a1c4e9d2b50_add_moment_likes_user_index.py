@@ -0,0 +1,25 @@
+"""add (user_name, moment_id) index on moment_likes
+
+Revision ID: 7a1c4e9d2b50
+Revises: 5d7f0a2b6e38
+Create Date: 2026-10-17 17:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "7a1c4e9d2b50"
+down_revision = "5d7f0a2b6e38"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_moment_likes_user_name_moment_id", "moment_likes", ["user_name", "moment_id"], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_moment_likes_user_name_moment_id", table_name="moment_likes")
@@ -0,0 +1,27 @@
+"""add (author_name, created_at, id) and session_id indexes on moments
+
+Revision ID: 9e2b6d4f1c87
+Revises: 7a1c4e9d2b50
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "9e2b6d4f1c87"
+down_revision = "7a1c4e9d2b50"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_moments_author_name_created_at", "moments", ["author_name", "created_at", "id"], unique=False
+    )
+    op.create_index("ix_moments_session_id", "moments", ["session_id"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_moments_session_id", table_name="moments")
+    op.drop_index("ix_moments_author_name_created_at", table_name="moments")
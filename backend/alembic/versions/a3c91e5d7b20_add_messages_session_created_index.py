@@ -0,0 +1,28 @@
+"""add messages (session_id, created_at) index
+
+Revision ID: a3c91e5d7b20
+Revises: 6f2f67dcbf36
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "a3c91e5d7b20"
+down_revision = "6f2f67dcbf36"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_messages_session_id_created_at",
+        "messages",
+        ["session_id", "created_at"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_messages_session_id_created_at", table_name="messages")
@@ -0,0 +1,106 @@
+"""add messages.token_count with backfill
+
+Revision ID: c5e8d2a4f613
+Revises: a3c91e5d7b20
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "c5e8d2a4f613"
+down_revision = "a3c91e5d7b20"
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger("alembic.runtime.migration")
+
+BACKFILL_BATCH_SIZE = 500
+# 与 TokenCounter.count_message_tokens 的估算一致
+IMAGE_TOKENS = 85
+
+messages_table = sa.table(
+    "messages",
+    sa.column("id", sa.String()),
+    sa.column("role", sa.String()),
+    sa.column("content", sa.Text()),
+    sa.column("image_urls", sa.JSON()),
+    sa.column("audio_text", sa.Text()),
+    sa.column("token_count", sa.Integer()),
+)
+
+
+def _load_encoding():
+    """直接使用 tiktoken 加载 cl100k_base，不导入应用代码与配置
+
+    离线环境可通过 TIKTOKEN_CACHE_DIR 提供编码文件；加载失败时跳过回填，
+    旧消息在首次被计入会话历史时由 ChatService 回写。
+    """
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as exc:
+        logger.warning("Skip messages.token_count backfill, tiktoken encoding unavailable: %s", exc)
+        return None
+
+
+def _count_message_tokens(encoding, row) -> int:
+    tokens = len(row["image_urls"] or []) * IMAGE_TOKENS
+    for field in ("content", "audio_text", "role"):
+        if row[field]:
+            tokens += len(encoding.encode(row[field], disallowed_special=()))
+    return tokens
+
+
+def upgrade() -> None:
+    op.add_column("messages", sa.Column("token_count", sa.Integer(), nullable=True))
+
+    encoding = _load_encoding()
+    if encoding is None:
+        return
+
+    # 按主键键集分批回填历史消息的token数量，每批一次批量 UPDATE
+    bind = op.get_bind()
+    last_id = None
+    while True:
+        query = (
+            sa.select(
+                messages_table.c.id,
+                messages_table.c.role,
+                messages_table.c.content,
+                messages_table.c.image_urls,
+                messages_table.c.audio_text,
+            )
+            .where(messages_table.c.token_count.is_(None))
+            .order_by(messages_table.c.id)
+            .limit(BACKFILL_BATCH_SIZE)
+        )
+        if last_id is not None:
+            query = query.where(messages_table.c.id > last_id)
+        rows = bind.execute(query).mappings().all()
+        if not rows:
+            break
+
+        bind.execute(
+            messages_table.update()
+            .where(messages_table.c.id == sa.bindparam("message_id"))
+            .values(token_count=sa.bindparam("message_token_count")),
+            [
+                {
+                    "message_id": row["id"],
+                    "message_token_count": _count_message_tokens(encoding, row),
+                }
+                for row in rows
+            ],
+        )
+        last_id = rows[-1]["id"]
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("messages") as batch_op:
+        batch_op.drop_column("token_count")
@@ -0,0 +1,103 @@
+"""add sessions message_count / last_message_at / preview_image_url
+
+Revision ID: e7b4c19a2d56
+Revises: c5e8d2a4f613
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "e7b4c19a2d56"
+down_revision = "c5e8d2a4f613"
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 500
+
+sessions_table = sa.table(
+    "sessions",
+    sa.column("id", sa.String()),
+    sa.column("message_count", sa.Integer()),
+    sa.column("last_message_at", sa.DateTime()),
+    sa.column("preview_image_url", sa.String()),
+)
+
+messages_table = sa.table(
+    "messages",
+    sa.column("session_id", sa.String()),
+    sa.column("role", sa.String()),
+    sa.column("image_urls", sa.JSON()),
+    sa.column("created_at", sa.DateTime()),
+)
+
+
+def upgrade() -> None:
+    op.add_column("sessions", sa.Column("message_count", sa.Integer(), nullable=False, server_default="0"))
+    op.add_column("sessions", sa.Column("last_message_at", sa.DateTime(), nullable=True))
+    op.add_column("sessions", sa.Column("preview_image_url", sa.String(), nullable=True))
+    # 会话列表按 (updated_at, id) 排序；id 作为键集分页的 tiebreaker
+    op.create_index("ix_sessions_updated_at_id", "sessions", ["updated_at", "id"], unique=False)
+
+    # 计数与最后消息时间用关联子查询一次回填
+    op.execute(
+        sessions_table.update().values(
+            message_count=sa.select(sa.func.count())
+            .where(messages_table.c.session_id == sessions_table.c.id)
+            .scalar_subquery(),
+            last_message_at=sa.select(sa.func.max(messages_table.c.created_at))
+            .where(messages_table.c.session_id == sessions_table.c.id)
+            .scalar_subquery(),
+        )
+    )
+
+    # 预览图取会话中最早一条带图消息的第一张图，分批处理
+    bind = op.get_bind()
+    last_id = ""
+    while True:
+        session_ids = bind.execute(
+            sa.select(sessions_table.c.id)
+            .where(sessions_table.c.id > last_id)
+            .order_by(sessions_table.c.id)
+            .limit(BACKFILL_BATCH_SIZE)
+        ).scalars().all()
+        if not session_ids:
+            break
+
+        previews = {}
+        rows = bind.execute(
+            sa.select(messages_table.c.session_id, messages_table.c.image_urls)
+            .where(
+                messages_table.c.session_id.in_(session_ids),
+                messages_table.c.image_urls.isnot(None),
+            )
+            .order_by(messages_table.c.session_id, messages_table.c.created_at)
+        )
+        for session_id, image_urls in rows:
+            if session_id in previews:
+                continue
+            first_image = next((url.strip() for url in image_urls or [] if (url or "").strip()), None)
+            if first_image:
+                previews[session_id] = first_image
+
+        if previews:
+            bind.execute(
+                sessions_table.update()
+                .where(sessions_table.c.id == sa.bindparam("target_id"))
+                .values(preview_image_url=sa.bindparam("target_preview")),
+                [
+                    {"target_id": session_id, "target_preview": preview}
+                    for session_id, preview in previews.items()
+                ],
+            )
+        last_id = session_ids[-1]
+
+
+def downgrade() -> None:
+    op.drop_index("ix_sessions_updated_at_id", table_name="sessions")
+    with op.batch_alter_table("sessions") as batch_op:
+        batch_op.drop_column("preview_image_url")
+        batch_op.drop_column("last_message_at")
+        batch_op.drop_column("message_count")
@@ -0,0 +1,24 @@
+"""add keyset pagination index for moments
+
+Revision ID: f1a6d3b8c470
+Revises: e7b4c19a2d56
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "f1a6d3b8c470"
+down_revision = "e7b4c19a2d56"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # 会话的 (updated_at, id) 索引已在 e7b4c19a2d56 中创建
+    op.create_index("ix_moments_created_at_id", "moments", ["created_at", "id"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_moments_created_at_id", table_name="moments")
@@ -1,7 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, HTTPException
 from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
-from app.core.database import get_db
 from app.schemas.chat import ChatRequest
 from app.services.chat_service import ChatService
 import asyncio
@@ -9,13 +7,14 @@ import asyncio
 router = APIRouter()
 
 @router.post("", response_class=StreamingResponse)
-async def chat(
-    request: ChatRequest,
-    db: Session = Depends(get_db)
-):
-    """处理聊天请求，流式返回响应"""
+async def chat(request: ChatRequest):
+    """处理聊天请求，流式返回响应
 
-    service = ChatService(db)
+    不注入请求级数据库会话：ChatService 按阶段自行开启短事务，
+    避免在整个流式响应期间占用连接池。
+    """
+
+    service = ChatService()
 
     async def generate():
         async for chunk in service.process_chat(
@@ -1,9 +1,16 @@
 # backend/app/api/endpoints/health.py
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
-from app.core.database import get_db
+from app.core.database import get_async_db
+from app.services.count_cache import list_count_cache
+from app.services.feed_cache import feed_cache
 from app.services.file_service import file_service
+from app.services.history_cache import session_history_cache
+from app.services.media_reconciler import media_reconciler
+from app.services.moment_counter_checker import moment_counter_checker
+from app.services.openai_service import openai_service
+from app.utils.token_counter import token_counter
 import logging
 from datetime import datetime
 
@@ -20,11 +27,11 @@ async def health_check():
     }
 
 @router.get("/db")
-async def health_check_db(db: Session = Depends(get_db)):
+async def health_check_db(db: AsyncSession = Depends(get_async_db)):
     """数据库健康检查"""
     try:
         # 执行简单的SQL查询检查数据库连接
-        result = db.execute(text("SELECT 1"))
+        result = await db.execute(text("SELECT 1"))
         db_ok = result.scalar() == 1
         return {
             "status": "healthy" if db_ok else "unhealthy",
@@ -52,3 +59,36 @@ async def health_check_services():
         },
         "timestamp": datetime.utcnow().isoformat() + "Z"
     }
+
+
+@router.get("/caches")
+async def health_check_caches():
+    """进程内缓存命中统计"""
+    return {
+        "caches": {
+            "token_count": token_counter.cache_stats(),
+            "session_history": session_history_cache.stats() if session_history_cache else None,
+            "image_data_url": openai_service.data_url_cache.stats(),
+            "list_counts": list_count_cache.stats(),
+            "moments_feed": feed_cache.stats() if feed_cache else None,
+        },
+        "timestamp": datetime.utcnow().isoformat() + "Z"
+    }
+
+
+@router.get("/media")
+async def health_check_media():
+    """最近一次失效媒体引用修复的统计"""
+    return {
+        "last_reconcile": media_reconciler.last_report,
+        "timestamp": datetime.utcnow().isoformat() + "Z"
+    }
+
+
+@router.get("/moment-counters")
+async def health_check_moment_counters():
+    """最近一次朋友圈点赞/评论计数校对的结果"""
+    return {
+        "last_check": moment_counter_checker.last_report,
+        "timestamp": datetime.utcnow().isoformat() + "Z"
+    }
@@ -1,25 +1,40 @@
+import uuid
 from datetime import datetime, timezone
-from pathlib import Path
-from urllib.parse import urlparse
-
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session, selectinload
+from typing import Literal
+
+import orjson
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import delete, func, literal, select, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
 
 from app.core.config import settings
-from app.core.database import get_db
+from app.core.database import get_async_db
 from app.models.moment import Moment, MomentLike, MomentComment
 from app.schemas.moment import (
     MomentAvatarBatchUpdateRequest,
     MomentAvatarBatchUpdateResponse,
     MomentCommentCreateRequest,
     MomentCommentResponse,
+    MomentCommentsPageResponse,
     MomentCreateRequest,
     MomentDeleteResponse,
+    MomentLikesPageResponse,
     MomentLikeToggleRequest,
     MomentLikeToggleResponse,
     MomentResponse,
     MomentsListResponse,
 )
+from app.services.count_cache import MOMENTS_COUNT_KEY, list_count_cache, moment_author_count_key
+from app.services.feed_cache import feed_cache, invalidate_feed, invalidate_feed_moment
+from app.services.list_versions import MOMENTS_LIST, bump_list_version, get_list_version
+from app.services.media_resolver import media_resolver
+from app.utils.http_cache import etag_matches, not_modified, weak_etag
+from app.utils.pagination import encode_cursor, keyset_after, keyset_before
 
 router = APIRouter()
 
@@ -37,151 +52,206 @@ def _to_utc_iso(value: datetime) -> str:
     return value.isoformat().replace("+00:00", "Z")
 
 
-def _extract_local_upload_relative_path(url: str) -> str | None:
-    if not url:
-        return None
-
-    if url.startswith("/uploads/"):
-        return url[len("/uploads/"):].lstrip("/")
-
-    try:
-        parsed = urlparse(url)
-    except Exception:
-        return None
+# 以下序列化函数直接产出与 MomentCommentResponse / MomentResponse 字段一致的 dict：
+# 列值类型由 ORM 列定义保证，列表接口用 orjson 直接编码，不再逐条构造并二次校验 Pydantic 模型
+
+
+def _serialize_comment(comment: MomentComment) -> dict:
+    return {
+        "id": comment.id,
+        "moment_id": comment.moment_id,
+        "parent_id": comment.parent_id,
+        "user_name": comment.user_name,
+        "reply_to_name": comment.reply_to_name,
+        "content": comment.content,
+        "created_at": _to_utc_iso(comment.created_at),
+    }
+
+
+def _serialize_moment(moment: Moment, preview: dict | None = None) -> dict:
+    """序列化动态；preview 为 _load_feed_previews 的结果，缺省表示没有点赞和评论"""
+    preview = preview or _empty_preview()
+    return {
+        "id": moment.id,
+        "author_name": moment.author_name,
+        "author_avatar_url": media_resolver.sanitize_media_url(moment.author_avatar_url),
+        "content": moment.content,
+        "image_urls": media_resolver.sanitize_image_urls(moment.image_urls),
+        "location": moment.location,
+        "session_id": moment.session_id,
+        "created_at": _to_utc_iso(moment.created_at),
+        "like_count": moment.like_count or 0,
+        "comment_count": moment.comment_count or 0,
+        "likes": preview["likes"],
+        "liked_by_me": preview["liked_by_me"],
+        "comments": [_serialize_comment(comment) for comment in preview["comments"]],
+    }
+
+
+def _empty_preview() -> dict:
+    return {"likes": [], "liked_by_me": False, "comments": []}
+
+
+def _liked_by_me_query(moment_ids: list[str], me: str):
+    return (
+        select(MomentLike.moment_id)
+        .where(MomentLike.user_name == me, MomentLike.moment_id.in_(moment_ids))
+    )
 
-    if parsed.path.startswith("/uploads/"):
-        return parsed.path[len("/uploads/"):].lstrip("/")
-    return None
 
+async def _load_feed_previews(db: AsyncSession, moment_ids: list[str], me: str) -> dict[str, dict]:
+    """批量读取一页动态的点赞/评论预览：最早 N 个点赞人、当前用户是否已赞、最新 N 条评论（按时间正序）
 
-def _local_upload_exists(url: str) -> bool | None:
-    """返回:
-    - True: 本地上传且文件存在
-    - False: 本地上传但文件不存在
-    - None: 非本地上传URL，无法在本地校验
+    用窗口函数在库内截断，每个动态只传输预览条数的行；总数直接读 moments 上的计数列。
     """
-    relative_path = _extract_local_upload_relative_path(url)
-    if relative_path is None:
-        return None
-
-    candidate = Path(relative_path)
-    if candidate.is_absolute() or ".." in candidate.parts:
-        return False
-
-    upload_root = Path(settings.LOCAL_UPLOAD_DIR).resolve()
-    target = (upload_root / candidate).resolve()
-    if upload_root not in target.parents and target != upload_root:
-        return False
-    return target.exists()
-
-
-def _sanitize_media_url(url: str | None) -> str | None:
-    normalized = (url or "").strip()
-    if not normalized:
-        return None
-
-    local_exists = _local_upload_exists(normalized)
-    if local_exists is False:
-        return None
-    return normalized
-
-
-def _sanitize_image_urls(image_urls: list[str] | None) -> list[str]:
-    sanitized: list[str] = []
-    for raw in image_urls or []:
-        normalized = (raw or "").strip()
-        if not normalized:
-            continue
-        local_exists = _local_upload_exists(normalized)
-        if local_exists is False:
-            continue
-        sanitized.append(normalized)
-    return sanitized
-
-
-def _serialize_comment(comment: MomentComment) -> MomentCommentResponse:
-    return MomentCommentResponse(
-        id=comment.id,
-        moment_id=comment.moment_id,
-        parent_id=comment.parent_id,
-        user_name=comment.user_name,
-        reply_to_name=comment.reply_to_name,
-        content=comment.content,
-        created_at=_to_utc_iso(comment.created_at),
+    previews = {moment_id: _empty_preview() for moment_id in moment_ids}
+    if not moment_ids:
+        return previews
+
+    like_limit = settings.MOMENT_FEED_LIKE_PREVIEW
+    ranked_likes = (
+        select(
+            MomentLike.moment_id,
+            MomentLike.user_name,
+            func.row_number().over(
+                partition_by=MomentLike.moment_id,
+                order_by=(MomentLike.created_at, MomentLike.id),
+            ).label("rank"),
+        )
+        .where(MomentLike.moment_id.in_(moment_ids))
+        .subquery()
+    )
+    like_rows = await db.execute(
+        select(ranked_likes.c.moment_id, ranked_likes.c.user_name)
+        .where(ranked_likes.c.rank <= like_limit)
+        .order_by(ranked_likes.c.moment_id, ranked_likes.c.rank)
     )
+    for moment_id, user_name in like_rows:
+        previews[moment_id]["likes"].append(user_name)
+
+    # liked_by_me 整页一次查询，走 (user_name, moment_id) 索引，与预览截断无关
+    liked_ids = await db.execute(_liked_by_me_query(moment_ids, me))
+    for moment_id in liked_ids.scalars():
+        previews[moment_id]["liked_by_me"] = True
+
+    ranked_comments = (
+        select(
+            MomentComment,
+            func.row_number().over(
+                partition_by=MomentComment.moment_id,
+                order_by=(MomentComment.created_at.desc(), MomentComment.id.desc()),
+            ).label("rank"),
+        )
+        .where(MomentComment.moment_id.in_(moment_ids))
+        .subquery()
+    )
+    comment_alias = aliased(MomentComment, ranked_comments)
+    comment_rows = await db.execute(
+        select(comment_alias)
+        .where(ranked_comments.c.rank <= settings.MOMENT_FEED_COMMENT_PREVIEW)
+        .order_by(ranked_comments.c.moment_id, ranked_comments.c.created_at, ranked_comments.c.id)
+    )
+    for comment in comment_rows.scalars():
+        previews[comment.moment_id]["comments"].append(comment)
 
+    return previews
 
-def _serialize_moment(moment: Moment, me: str = "你") -> MomentResponse:
-    likes = [like.user_name for like in sorted(moment.likes, key=lambda x: x.created_at)]
-    comments = sorted(moment.comments, key=lambda x: x.created_at)
-
-    return MomentResponse(
-        id=moment.id,
-        author_name=moment.author_name,
-        author_avatar_url=_sanitize_media_url(moment.author_avatar_url),
-        content=moment.content,
-        image_urls=_sanitize_image_urls(moment.image_urls),
-        location=moment.location,
-        session_id=moment.session_id,
-        created_at=_to_utc_iso(moment.created_at),
-        like_count=len(likes),
-        comment_count=len(comments),
-        likes=likes,
-        liked_by_me=me in likes,
-        comments=[_serialize_comment(comment) for comment in comments],
-    )
+
+def _feed_query(cursor: str | None = None, author: str | None = None):
+    """朋友圈列表查询，按 (created_at, id) 倒序；cursor 非法时抛出 ValueError
+
+    指定 author 时为个人时间线，沿 (author_name, created_at, id) 索引读取，代价只与该作者的动态数相关。
+    """
+    query = select(Moment).order_by(Moment.created_at.desc(), Moment.id.desc())
+    if author is not None:
+        query = query.where(Moment.author_name == author)
+    if cursor:
+        # 键集分页：按 (created_at, id) 定位，深翻页与第一页代价一致
+        query = query.where(keyset_before(Moment.created_at, Moment.id, cursor))
+    return query
 
 
 @router.get("", response_model=MomentsListResponse)
-def get_moments(
+async def get_moments(
     page: int = Query(1, ge=1),
     limit: int = Query(20, ge=1, le=50),
+    cursor: str | None = Query(None, max_length=512),
+    include_total: bool = Query(True),
     me: str = Query("你"),
-    db: Session = Depends(get_db),
+    author: str | None = Query(None, max_length=64),
+    if_none_match: str | None = Header(None),
+    db: AsyncSession = Depends(get_async_db),
 ):
+    """朋友圈列表；author 非空时只返回该作者的动态（个人时间线），分页方式相同"""
     offset = (page - 1) * limit
     me_name = _normalize_username(me)
-
-    total = db.query(Moment).count()
-    rows = (
-        db.query(Moment)
-        .options(
-            selectinload(Moment.likes),
-            selectinload(Moment.comments),
+    author_name = (author or "").strip() or None
+
+    # 热点页直接返回缓存的 JSON 正文，不访问数据库
+    cache_key = cache_snapshot = None
+    if feed_cache is not None:
+        cache_key = feed_cache.make_key(page, cursor, limit, include_total, me_name, author_name)
+        cached = await feed_cache.get(cache_key)
+        if cached is not None:
+            body, cached_etag = cached
+            if etag_matches(if_none_match, cached_etag):
+                return not_modified(cached_etag)
+            return Response(content=body, media_type="application/json", headers={"ETag": cached_etag})
+        cache_snapshot = await feed_cache.snapshot()
+
+    # 版本标记：max(updated_at)（点赞/评论/编辑都会刷新）+ 写入计数器（覆盖发布、删除），命中时不加载任何动态；
+    # 均为索引/主键查询；个人时间线沿用全表标记。总数只在 include_total 时统计
+    latest = await db.scalar(select(func.max(Moment.updated_at)))
+    version = await get_list_version(db, MOMENTS_LIST)
+    etag = weak_etag("moments", latest, version, page, limit, cursor, include_total, me_name, author_name)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    moment_count = None
+    if include_total and author_name is None:
+        moment_count = await list_count_cache.get_or_load(
+            MOMENTS_COUNT_KEY,
+            lambda: db.scalar(select(func.count()).select_from(Moment)),
+        )
+    elif include_total:
+        # 作者总数走 (author_name, created_at, id) 索引
+        moment_count = await list_count_cache.get_or_load(
+            moment_author_count_key(author_name),
+            lambda: db.scalar(select(func.count()).select_from(Moment).where(Moment.author_name == author_name)),
         )
-        .order_by(Moment.created_at.desc())
-        .offset(offset)
-        .limit(limit)
-        .all()
-    )
 
-    # 清理已失效的本地上传URL，避免前端长期展示404坏图占位
-    changed = False
-    for moment in rows:
-        sanitized_avatar = _sanitize_media_url(moment.author_avatar_url)
-        sanitized_images = _sanitize_image_urls(moment.image_urls)
-        if sanitized_avatar != moment.author_avatar_url:
-            moment.author_avatar_url = sanitized_avatar
-            changed = True
-        if sanitized_images != (moment.image_urls or []):
-            moment.image_urls = sanitized_images
-            changed = True
-    if changed:
-        db.commit()
-
-    return MomentsListResponse(
-        moments=[_serialize_moment(moment, me=me_name) for moment in rows],
-        total=total,
-        page=page,
-        limit=limit,
-        has_more=offset + len(rows) < total,
-    )
+    try:
+        query = _feed_query(cursor, author_name)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    if not cursor:
+        query = query.offset(offset)
+
+    # 多取一行判断是否还有下一页
+    result = await db.execute(query.limit(limit + 1))
+    rows = result.scalars().all()
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+    previews = await _load_feed_previews(db, [moment.id for moment in rows], me_name)
+
+    # 纯读：失效的本地上传URL仅在序列化时过滤，落库修复由后台 media_reconciler 完成
+    body = orjson.dumps({
+        "moments": [_serialize_moment(moment, previews[moment.id]) for moment in rows],
+        "total": moment_count,
+        "page": page,
+        "limit": limit,
+        "has_more": has_next,
+        "next_cursor": encode_cursor(rows[-1].created_at, rows[-1].id) if has_next else None,
+    })
+    if feed_cache is not None:
+        await feed_cache.put(cache_key, body, etag, [moment.id for moment in rows], cache_snapshot)
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
 
 
 @router.post("", response_model=MomentResponse)
-def create_moment(payload: MomentCreateRequest, db: Session = Depends(get_db)):
+async def create_moment(payload: MomentCreateRequest, db: AsyncSession = Depends(get_async_db)):
     content = payload.content.strip()
-    image_urls = _sanitize_image_urls(payload.image_urls)
+    image_urls = media_resolver.sanitize_image_urls(payload.image_urls)
 
     if not content and not image_urls:
         raise HTTPException(status_code=400, detail="内容和图片不能同时为空")
@@ -196,26 +266,29 @@ def create_moment(payload: MomentCreateRequest, db: Session = Depends(get_db)):
     )
 
     db.add(moment)
-    db.commit()
-    db.refresh(moment)
-
-    # 保证序列化时关系可用
-    moment.likes = []
-    moment.comments = []
+    await bump_list_version(db, MOMENTS_LIST)
+    await db.commit()
+    list_count_cache.invalidate(MOMENTS_COUNT_KEY)
+    list_count_cache.invalidate(moment_author_count_key(moment.author_name))
+    await invalidate_feed()
     return _serialize_moment(moment)
 
 
 @router.patch("/avatar", response_model=MomentAvatarBatchUpdateResponse)
-def batch_update_avatar(payload: MomentAvatarBatchUpdateRequest, db: Session = Depends(get_db)):
+async def batch_update_avatar(payload: MomentAvatarBatchUpdateRequest, db: AsyncSession = Depends(get_async_db)):
     user_name = _normalize_username(payload.user_name)
     avatar_url = payload.author_avatar_url.strip()
 
-    updated_count = (
-        db.query(Moment)
-        .filter(Moment.author_name == user_name)
-        .update({Moment.author_avatar_url: avatar_url}, synchronize_session=False)
+    result = await db.execute(
+        update(Moment)
+        .where(Moment.author_name == user_name)
+        .values(author_avatar_url=avatar_url)
+        .execution_options(synchronize_session=False)
     )
-    db.commit()
+    updated_count = result.rowcount
+    await db.commit()
+    if updated_count:
+        await invalidate_feed()
 
     return MomentAvatarBatchUpdateResponse(
         user_name=user_name,
@@ -224,74 +297,243 @@ def batch_update_avatar(payload: MomentAvatarBatchUpdateRequest, db: Session = D
     )
 
 
+async def _bump_moment_counter(db: AsyncSession, moment_id: str, column, delta: int) -> int:
+    """UPDATE moments SET <counter> = <counter> ± 1 并返回新值；由调用方提交"""
+    return await db.scalar(
+        update(Moment)
+        .where(Moment.id == moment_id)
+        .values({column: column + delta, Moment.updated_at: datetime.utcnow()})
+        .returning(column)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def _ensure_moment_exists(db: AsyncSession, moment_id: str) -> None:
+    exists = await db.scalar(select(Moment.id).where(Moment.id == moment_id))
+    if not exists:
+        raise HTTPException(status_code=404, detail="动态不存在")
+
+
+@router.get("/{moment_id}/comments", response_model=MomentCommentsPageResponse)
+async def get_moment_comments(
+    moment_id: str,
+    cursor: str | None = Query(None, max_length=512),
+    limit: int = Query(20, ge=1, le=100),
+    order: Literal["asc", "desc"] = Query("asc"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """评论分页：按 (created_at, id) 游标；order=desc 从最新评论向前翻页"""
+    await _ensure_moment_exists(db, moment_id)
+
+    query = select(MomentComment).where(MomentComment.moment_id == moment_id)
+    try:
+        if order == "desc":
+            query = query.order_by(MomentComment.created_at.desc(), MomentComment.id.desc())
+            if cursor:
+                query = query.where(keyset_before(MomentComment.created_at, MomentComment.id, cursor))
+        else:
+            query = query.order_by(MomentComment.created_at, MomentComment.id)
+            if cursor:
+                query = query.where(keyset_after(MomentComment.created_at, MomentComment.id, cursor))
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    rows = (await db.execute(query.limit(limit + 1))).scalars().all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return ORJSONResponse({
+        "moment_id": moment_id,
+        "comments": [_serialize_comment(comment) for comment in rows],
+        "has_more": has_more,
+        "next_cursor": encode_cursor(rows[-1].created_at, rows[-1].id) if has_more else None,
+    })
+
+
+@router.get("/{moment_id}/likes", response_model=MomentLikesPageResponse)
+async def get_moment_likes(
+    moment_id: str,
+    cursor: str | None = Query(None, max_length=512),
+    limit: int = Query(50, ge=1, le=200),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """点赞人分页：按点赞时间正序，(created_at, id) 游标"""
+    await _ensure_moment_exists(db, moment_id)
+
+    query = (
+        select(MomentLike.user_name, MomentLike.created_at, MomentLike.id)
+        .where(MomentLike.moment_id == moment_id)
+        .order_by(MomentLike.created_at, MomentLike.id)
+    )
+    if cursor:
+        try:
+            query = query.where(keyset_after(MomentLike.created_at, MomentLike.id, cursor))
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+
+    rows = (await db.execute(query.limit(limit + 1))).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return ORJSONResponse({
+        "moment_id": moment_id,
+        "likes": [row.user_name for row in rows],
+        "has_more": has_more,
+        "next_cursor": encode_cursor(rows[-1].created_at, rows[-1].id) if has_more else None,
+    })
+
+
 @router.post("/{moment_id}/likes/toggle", response_model=MomentLikeToggleResponse)
-def toggle_like(
+async def toggle_like(
     moment_id: str,
     payload: MomentLikeToggleRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
+    """切换点赞：PostgreSQL 上一条数据修改CTE完成删除/条件插入/计数更新，SQLite 依次执行
+
+    唯一约束 uq_moment_like_user 保证并发点赞不重复，DELETE RETURNING 保证并发取消只扣减一次；
+    计数更新同时校验动态存在。返回新的总数与前 N 个点赞人预览。
+    """
     me = _normalize_username(payload.user_name)
 
-    moment = (
-        db.query(Moment)
-        .options(selectinload(Moment.likes))
-        .filter(Moment.id == moment_id)
-        .first()
-    )
-    if not moment:
+    try:
+        if db.get_bind().dialect.name == "postgresql":
+            row = (await db.execute(_toggle_like_statement(moment_id, me))).one_or_none()
+            if row is None:
+                raise HTTPException(status_code=404, detail="动态不存在")
+            like_count, liked = row
+        else:
+            # SQLite 不支持 DML 的 CTE：DELETE RETURNING → 条件 INSERT → 计数更新，同一事务内依次执行
+            deleted_id = await db.scalar(
+                delete(MomentLike)
+                .where(MomentLike.moment_id == moment_id, MomentLike.user_name == me)
+                .returning(MomentLike.id)
+            )
+            if deleted_id is not None:
+                liked, delta = False, -1
+            else:
+                inserted_id = await db.scalar(_insert_like_ignoring_conflict(db, moment_id, me))
+                # 未插入说明并发请求已点赞：状态即为已赞，计数不变
+                liked, delta = True, 1 if inserted_id is not None else 0
+
+            like_count = await _bump_moment_counter(db, moment_id, Moment.like_count, delta)
+            if like_count is None:
+                raise HTTPException(status_code=404, detail="动态不存在")
+        await db.commit()
+    except IntegrityError:
+        # EXISTS 检查之后动态被并发删除，外键校验失败
+        await db.rollback()
         raise HTTPException(status_code=404, detail="动态不存在")
+    except Exception:
+        await db.rollback()
+        raise
+    await invalidate_feed_moment(moment_id)
+
+    likes_result = await db.execute(
+        select(MomentLike.user_name)
+        .where(MomentLike.moment_id == moment_id)
+        .order_by(MomentLike.created_at, MomentLike.id)
+        .limit(settings.MOMENT_FEED_LIKE_PREVIEW)
+    )
 
-    existing = (
-        db.query(MomentLike)
-        .filter(MomentLike.moment_id == moment_id, MomentLike.user_name == me)
-        .first()
+    return MomentLikeToggleResponse(
+        moment_id=moment_id,
+        liked=liked,
+        like_count=like_count,
+        likes=list(likes_result.scalars().all()),
     )
 
-    if existing:
-        db.delete(existing)
-        liked = False
-    else:
-        db.add(MomentLike(moment_id=moment_id, user_name=me))
-        liked = True
 
-    db.commit()
+def _toggle_like_statement(moment_id: str, user_name: str):
+    """PostgreSQL 单语句切换点赞，返回 (like_count, liked)；动态不存在时无返回行
+
+    WITH deleted AS (DELETE ... RETURNING id),
+         inserted AS (INSERT ... SELECT ... WHERE NOT EXISTS (deleted) AND EXISTS (动态)
+                      ON CONFLICT DO NOTHING RETURNING id),
+         bumped AS (UPDATE moments SET like_count = like_count + |inserted| - |deleted| RETURNING like_count)
+    SELECT bumped.like_count, NOT EXISTS (deleted)
 
-    likes = (
-        db.query(MomentLike)
-        .filter(MomentLike.moment_id == moment_id)
-        .order_by(MomentLike.created_at.asc())
-        .all()
+    各子语句共享同一快照，插入分支看不到删除结果，因此由 NOT EXISTS (deleted) 互斥。
+    """
+    deleted = (
+        delete(MomentLike)
+        .where(MomentLike.moment_id == moment_id, MomentLike.user_name == user_name)
+        .returning(MomentLike.id)
+        .cte("deleted")
+    )
+    # 嵌套在 CTE 中的 INSERT 不会预取列的 Python 默认值，主键与时间显式给出
+    now = datetime.utcnow()
+    source = select(
+        literal(str(uuid.uuid4())),
+        literal(moment_id),
+        literal(user_name),
+        literal(now, MomentLike.created_at.type),
+    ).where(
+        ~select(deleted.c.id).exists(),
+        select(Moment.id).where(Moment.id == moment_id).exists(),
     )
-    like_names = [item.user_name for item in likes]
+    inserted = (
+        postgresql_insert(MomentLike)
+        .from_select(["id", "moment_id", "user_name", "created_at"], source)
+        .on_conflict_do_nothing(constraint="uq_moment_like_user")
+        .returning(MomentLike.id)
+        .cte("inserted")
+    )
+    delta = (
+        select(func.count()).select_from(inserted).scalar_subquery()
+        - select(func.count()).select_from(deleted).scalar_subquery()
+    )
+    bumped = (
+        update(Moment)
+        .where(Moment.id == moment_id)
+        .values({Moment.like_count: Moment.like_count + delta, Moment.updated_at: now})
+        .returning(Moment.like_count)
+        .cte("bumped")
+    )
+    return select(bumped.c.like_count, (~select(deleted.c.id).exists()).label("liked"))
 
-    return MomentLikeToggleResponse(
-        moment_id=moment_id,
-        liked=liked,
-        like_count=len(like_names),
-        likes=like_names,
+
+def _insert_like_ignoring_conflict(db: AsyncSession, moment_id: str, user_name: str):
+    """INSERT ... SELECT ... WHERE EXISTS (动态) ON CONFLICT (moment_id, user_name) DO NOTHING RETURNING id
+
+    ON CONFLICT 只覆盖唯一约束：动态不存在（或已被并发删除）时改由 EXISTS 条件不插入，
+    而不是触发外键错误，调用方随后按计数更新无返回值处理为 404。
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        insert_factory = postgresql_insert
+    elif dialect == "sqlite":
+        insert_factory = sqlite_insert
+    else:
+        raise RuntimeError(f"不支持的数据库方言: {dialect}")
+    source = select(literal(moment_id), literal(user_name)).where(
+        select(Moment.id).where(Moment.id == moment_id).exists()
     )
+    statement = insert_factory(MomentLike).from_select(["moment_id", "user_name"], source)
+    if dialect == "postgresql":
+        statement = statement.on_conflict_do_nothing(constraint="uq_moment_like_user")
+    else:
+        statement = statement.on_conflict_do_nothing(index_elements=["moment_id", "user_name"])
+    return statement.returning(MomentLike.id)
 
 
 @router.post("/{moment_id}/comments", response_model=MomentCommentResponse)
-def add_comment(
+async def add_comment(
     moment_id: str,
     payload: MomentCommentCreateRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    moment = db.query(Moment).filter(Moment.id == moment_id).first()
+    moment = await db.get(Moment, moment_id)
     if not moment:
         raise HTTPException(status_code=404, detail="动态不存在")
 
     parent_id = payload.parent_id
     reply_to_name = (payload.reply_to_name or "").strip() or None
     if parent_id:
-        parent_comment = (
-            db.query(MomentComment)
-            .filter(
+        parent_comment = await db.scalar(
+            select(MomentComment)
+            .where(
                 MomentComment.id == parent_id,
                 MomentComment.moment_id == moment_id,
             )
-            .first()
         )
         if not parent_comment:
             raise HTTPException(status_code=404, detail="回复目标不存在")
@@ -306,26 +548,32 @@ def add_comment(
         content=payload.content.strip(),
     )
     db.add(comment)
-    db.commit()
-    db.refresh(comment)
+    await db.flush()
+    await _bump_moment_counter(db, moment_id, Moment.comment_count, 1)
+    await db.commit()
+    await invalidate_feed_moment(moment_id)
     return _serialize_comment(comment)
 
 
 @router.delete("/{moment_id}", response_model=MomentDeleteResponse)
-def delete_moment(
+async def delete_moment(
     moment_id: str,
     user_name: str = Query("你"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     me = _normalize_username(user_name)
 
-    moment = db.query(Moment).filter(Moment.id == moment_id).first()
+    moment = await db.get(Moment, moment_id)
     if not moment:
         raise HTTPException(status_code=404, detail="动态不存在")
 
     if moment.author_name != me:
         raise HTTPException(status_code=403, detail="只能删除自己发布的动态")
 
-    db.delete(moment)
-    db.commit()
+    await db.delete(moment)
+    await bump_list_version(db, MOMENTS_LIST)
+    await db.commit()
+    list_count_cache.invalidate(MOMENTS_COUNT_KEY)
+    list_count_cache.invalidate(moment_author_count_key(moment.author_name))
+    await invalidate_feed()
     return MomentDeleteResponse(moment_id=moment_id, deleted=True)
@@ -1,66 +1,29 @@
 from datetime import datetime, timezone
-from fastapi import APIRouter, Depends, Query, HTTPException
-from sqlalchemy.orm import Session
-from pathlib import Path
-from urllib.parse import urlparse, unquote
-from app.core.database import get_db
-from app.core.config import settings
+from typing import Literal, Optional
+import orjson
+from fastapi import APIRouter, Depends, Header, Query, HTTPException
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import AsyncSessionLocal, get_async_db
 from app.schemas.chat import SessionsResponse, ClearSessionsResponse, SessionToMomentRequest
 from app.schemas.moment import MomentResponse
 from app.services.chat_service import ChatService
+from app.services.count_cache import MOMENTS_COUNT_KEY, list_count_cache, moment_author_count_key
+from app.services.feed_cache import invalidate_feed
+from app.services.list_versions import MOMENTS_LIST, bump_list_version
+from app.services.media_resolver import media_resolver
 from app.services.openai_service import openai_service
 from app.models.message import Message as MessageModel
 from app.models.moment import Moment as MomentModel
 from app.models.session import Session as SessionModel
+from app.utils.http_cache import etag_matches, not_modified, weak_etag
+from app.utils.pagination import newer_than, older_than
 
 router = APIRouter()
 
-
-def _extract_local_upload_relative_path(url: str) -> str | None:
-    if not url:
-        return None
-
-    normalized = url.strip()
-    if normalized.startswith("/uploads/"):
-        return normalized[len("/uploads/"):].lstrip("/")
-
-    try:
-        parsed = urlparse(normalized)
-    except Exception:
-        return None
-
-    if parsed.path.startswith("/uploads/"):
-        return unquote(parsed.path[len("/uploads/"):].lstrip("/"))
-    return None
-
-
-def _local_upload_exists(url: str) -> bool | None:
-    relative_path = _extract_local_upload_relative_path(url)
-    if relative_path is None:
-        return None
-
-    candidate = Path(relative_path)
-    if candidate.is_absolute() or ".." in candidate.parts:
-        return False
-
-    upload_root = Path(settings.LOCAL_UPLOAD_DIR).resolve()
-    target = (upload_root / candidate).resolve()
-    if upload_root not in target.parents and target != upload_root:
-        return False
-    return target.exists()
-
-
-def _sanitize_image_urls(image_urls: list[str] | None) -> list[str]:
-    sanitized: list[str] = []
-    for raw in image_urls or []:
-        normalized = (raw or "").strip()
-        if not normalized:
-            continue
-        exists = _local_upload_exists(normalized)
-        if exists is False:
-            continue
-        sanitized.append(normalized)
-    return sanitized
+# NDJSON 流式输出时每次从服务端游标读取的行数
+MESSAGE_STREAM_BATCH_SIZE = 200
 
 
 def _normalize_username(name: str | None, default: str = "你") -> str:
@@ -113,7 +76,7 @@ def _collect_moment_images(messages: list[MessageModel]) -> list[str]:
     for msg in messages:
         if msg.role != "user":
             continue
-        for image in _sanitize_image_urls(msg.image_urls):
+        for image in media_resolver.sanitize_image_urls(msg.image_urls):
             if image in seen:
                 continue
             images.append(image)
@@ -123,73 +86,184 @@ def _collect_moment_images(messages: list[MessageModel]) -> list[str]:
     return images
 
 @router.get("", response_model=SessionsResponse)
-def get_sessions(
+async def get_sessions(
     page: int = Query(1, ge=1),
     limit: int = Query(20, ge=1, le=100),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None, max_length=512),
+    include_total: bool = Query(True),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """获取对话列表"""
+    """获取对话列表；优先使用 next_cursor 翻页，page 参数保留兼容"""
     service = ChatService(db)
-    return service.get_sessions(page=page, limit=limit)
+    latest, version = await service.get_sessions_version()
+    etag = weak_etag("sessions", latest, version, page, limit, cursor, include_total)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    try:
+        payload = await service.get_sessions(
+            page=page, limit=limit, cursor=cursor, include_total=include_total
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    # payload 已是与 SessionsResponse 一致的 dict，直接编码，跳过 response_model 的逐条校验
+    return ORJSONResponse(payload, headers={"ETag": etag})
 
 @router.delete("", response_model=ClearSessionsResponse)
-def clear_sessions(
-    db: Session = Depends(get_db)
+async def clear_sessions(
+    db: AsyncSession = Depends(get_async_db)
 ):
     """清空全部历史对话"""
     service = ChatService(db)
-    return service.clear_sessions()
+    return await service.clear_sessions()
+
+def _serialize_message(msg: MessageModel) -> dict:
+    return {
+        "id": msg.id,
+        "role": msg.role,
+        "content": msg.content,
+        "image_urls": media_resolver.sanitize_image_urls(msg.image_urls),
+        "audio_text": msg.audio_text,
+        "created_at": msg.created_at.isoformat()
+    }
+
+
+async def _message_anchor(db: AsyncSession, session_id: str, message_id: str) -> datetime:
+    """读取游标消息的 created_at；消息不属于该会话时视为无效游标"""
+    created_at = await db.scalar(
+        select(MessageModel.created_at)
+        .where(MessageModel.id == message_id, MessageModel.session_id == session_id)
+    )
+    if created_at is None:
+        raise HTTPException(400, "无效的消息游标")
+    return created_at
+
+
+async def _build_messages_query(
+    db: AsyncSession,
+    session_id: str,
+    before: Optional[str],
+    after: Optional[str],
+    order: str,
+):
+    query = select(MessageModel).where(MessageModel.session_id == session_id)
+    if before:
+        anchor = await _message_anchor(db, session_id, before)
+        query = query.where(older_than(MessageModel.created_at, MessageModel.id, anchor, before))
+    if after:
+        anchor = await _message_anchor(db, session_id, after)
+        query = query.where(newer_than(MessageModel.created_at, MessageModel.id, anchor, after))
+
+    if order == "desc":
+        return query.order_by(MessageModel.created_at.desc(), MessageModel.id.desc())
+    return query.order_by(MessageModel.created_at, MessageModel.id)
+
+
+async def _stream_messages_ndjson(session_payload: dict, query, limit: Optional[int]):
+    """NDJSON：首行为会话信息，之后每行一条消息；使用独立会话与服务端游标逐批读取
+
+    末行为 {"meta": {"has_more", "next_cursor"}}，与非流式响应的分页字段一致。
+    """
+    yield orjson.dumps({"session": session_payload}) + b"\n"
+    if limit is not None:
+        # 多取一行判断该方向上是否还有更多消息
+        query = query.limit(limit + 1)
+    has_more = False
+    last_id = None
+    streamed = 0
+    async with AsyncSessionLocal() as db:
+        result = await db.stream_scalars(query.execution_options(yield_per=MESSAGE_STREAM_BATCH_SIZE))
+        async for msg in result:
+            if limit is not None and streamed == limit:
+                has_more = True
+                break
+            yield orjson.dumps({"message": _serialize_message(msg)}) + b"\n"
+            last_id = msg.id
+            streamed += 1
+    yield orjson.dumps({"meta": {"has_more": has_more, "next_cursor": last_id if has_more else None}}) + b"\n"
+
 
 @router.get("/{session_id}/messages")
-def get_session_messages(
+async def get_session_messages(
     session_id: str,
-    db: Session = Depends(get_db)
+    before: Optional[str] = Query(None, max_length=64),
+    after: Optional[str] = Query(None, max_length=64),
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    order: Literal["asc", "desc"] = Query("asc"),
+    stream: bool = Query(False),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """获取对话消息历史"""
-    session = db.query(SessionModel).filter(SessionModel.id == session_id).first()
+    """获取对话消息历史
+
+    before/after 为消息 id 游标，按 (created_at, id) 定位；order=desc 时从最新消息开始，
+    适合聊天界面向上翻页。stream=true 时以 NDJSON 流式输出，内存占用与会话长度无关。
+    不带参数时返回完整历史（兼容旧客户端）。
+    会话的 updated_at 与 message_count 随每条消息写入变化，作为 ETag 版本标记。
+    """
+    session = await db.get(SessionModel, session_id)
     if not session:
         raise HTTPException(404, "对话不存在")
 
-    messages = db.query(MessageModel).filter(
-        MessageModel.session_id == session_id
-    ).order_by(MessageModel.created_at).all()
+    etag = weak_etag(
+        "messages", session.id, session.updated_at, session.message_count,
+        before, after, limit, order, stream
+    )
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
 
-    return {
-        "session": {
-            "id": session.id,
-            "title": session.title or f"对话 {session.id[:8]}"
-        },
-        "messages": [
-            {
-                "id": msg.id,
-                "role": msg.role,
-                "content": msg.content,
-                "image_urls": _sanitize_image_urls(msg.image_urls),
-                "audio_text": msg.audio_text,
-                "created_at": msg.created_at.isoformat()
-            }
-            for msg in messages
-        ]
+    session_payload = {
+        "id": session.id,
+        "title": session.title or f"对话 {session.id[:8]}"
     }
+    query = await _build_messages_query(db, session_id, before, after, order)
+
+    if stream:
+        # yield 依赖在响应结束后才关闭，先释放请求会话的连接，流式期间只占用流自己的一个连接
+        await db.close()
+        return StreamingResponse(
+            _stream_messages_ndjson(session_payload, query, limit),
+            media_type="application/x-ndjson",
+            headers={"ETag": etag}
+        )
+
+    if limit is not None:
+        # 多取一行判断该方向上是否还有更多消息
+        query = query.limit(limit + 1)
+    messages = (await db.execute(query)).scalars().all()
+    has_more = limit is not None and len(messages) > limit
+    if has_more:
+        messages = messages[:limit]
+
+    return ORJSONResponse(
+        {
+            "session": session_payload,
+            "messages": [_serialize_message(msg) for msg in messages],
+            "has_more": has_more,
+            "next_cursor": messages[-1].id if has_more else None
+        },
+        headers={"ETag": etag}
+    )
 
 
 @router.post("/{session_id}/moment", response_model=MomentResponse)
 async def create_moment_from_session(
     session_id: str,
     payload: SessionToMomentRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """从历史对话一键生成朋友圈动态"""
-    session = db.query(SessionModel).filter(SessionModel.id == session_id).first()
+    session = await db.get(SessionModel, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="对话不存在")
 
-    messages = (
-        db.query(MessageModel)
-        .filter(MessageModel.session_id == session_id)
+    result = await db.execute(
+        select(MessageModel)
+        .where(MessageModel.session_id == session_id)
         .order_by(MessageModel.created_at.asc())
-        .all()
     )
+    messages = list(result.scalars().all())
     if not messages:
         raise HTTPException(status_code=400, detail="该对话暂无可生成的内容")
 
@@ -218,8 +292,11 @@ async def create_moment_from_session(
         session_id=session_id,
     )
     db.add(moment)
-    db.commit()
-    db.refresh(moment)
+    await bump_list_version(db, MOMENTS_LIST)
+    await db.commit()
+    list_count_cache.invalidate(MOMENTS_COUNT_KEY)
+    list_count_cache.invalidate(moment_author_count_key(moment.author_name))
+    await invalidate_feed()
 
     return MomentResponse(
         id=moment.id,
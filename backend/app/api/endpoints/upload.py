@@ -1,13 +1,14 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Request
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 import tempfile
 import os
 import logging
 import uuid
 from pathlib import Path
-from app.core.database import get_db
+from app.core.database import get_async_db
 from app.core.config import settings
 from app.services.file_service import file_service
+from app.services.media_resolver import media_resolver
 from app.services.openai_service import openai_service
 from app.models.file import File as FileModel
 
@@ -54,6 +55,7 @@ def _save_local_upload(
 
     public_id = f"local/{category}/{stored_name}"
     relative_path = f"{category}/{stored_name}"
+    media_resolver.register(relative_path)
     url = _build_public_upload_url(request, relative_path)
 
     return url, public_id, extension.lstrip(".")
@@ -76,7 +78,7 @@ def _build_public_upload_url(request: Request, path: str) -> str:
 async def upload_file(
     request: Request,
     file: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """上传文件，优先Cloudinary，失败时回退本地存储。"""
 
@@ -156,7 +158,7 @@ async def upload_file(
             size=len(content)
         )
         db.add(file_record)
-        db.commit()
+        await db.commit()
 
         return {
             "url": url,
@@ -174,7 +176,7 @@ async def upload_file(
 @router.post("/transcribe")
 async def transcribe_audio(
     audio: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """转录音频文件为文字"""
 
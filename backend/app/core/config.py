@@ -21,6 +21,14 @@ class Settings(BaseSettings):
     CLOUDINARY_API_SECRET: Optional[str] = None
     LOCAL_UPLOAD_DIR: str = "./uploads"
     ALLOW_LOCAL_UPLOAD_FALLBACK: bool = True
+    # 本地上传文件不存在结果的负缓存时长（秒）
+    MEDIA_NEGATIVE_CACHE_TTL_SECONDS: float = 30.0
+    # 已知存在结果的缓存时长（秒），过期后重新检查文件系统，运行期间被删除的文件最多延迟这么久才被发现
+    MEDIA_POSITIVE_CACHE_TTL_SECONDS: float = 300.0
+    # 后台修复失效本地上传引用的周期（秒），0 表示关闭
+    MEDIA_RECONCILE_INTERVAL_SECONDS: float = 600.0
+    # 本地文件缺失时是否删除 files 表记录；默认只统计上报，避免挂载异常时误删上传元数据
+    MEDIA_RECONCILE_DELETE_MISSING_FILES: bool = False
 
     # CORS
     CORS_ORIGINS: List[str] = ["http://localhost:3000"]
@@ -31,6 +39,45 @@ class Settings(BaseSettings):
     RATE_LIMIT_DEFAULT: str = "100/minute"
     REDIS_URL: str = "redis://localhost:6379/0"
 
+    # tiktoken 编码：可指向本地 cl100k_base BPE 文件供离线容器使用；启动时后台预热
+    TIKTOKEN_ENCODING_FILE: Optional[str] = None
+    TOKEN_COUNTER_WARMUP: bool = True
+
+    # token计数缓存（按文本哈希的LRU，默认关闭）
+    TOKEN_COUNT_CACHE_ENABLED: bool = False
+    TOKEN_COUNT_CACHE_MAX_ENTRIES: int = 4096
+    TOKEN_COUNT_CACHE_MAX_BYTES: int = 4 * 1024 * 1024
+
+    # 进程内会话历史缓存（按会话数与字节数LRU淘汰）
+    HISTORY_CACHE_ENABLED: bool = True
+    HISTORY_CACHE_MAX_SESSIONS: int = 1000
+    HISTORY_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+
+    # 本地上传图片送入模型前的缩小变体（最长边、格式 JPEG/WEBP、质量）
+    IMAGE_PROMPT_VARIANT_ENABLED: bool = True
+    IMAGE_PROMPT_VARIANT_MAX_SIDE: int = 1024
+    IMAGE_PROMPT_VARIANT_FORMAT: str = "JPEG"
+    IMAGE_PROMPT_VARIANT_QUALITY: int = 85
+
+    # 后台校对 moments.like_count / comment_count 的周期（秒），0 表示关闭
+    MOMENT_COUNTER_CHECK_INTERVAL_SECONDS: float = 3600.0
+
+    # 朋友圈列表每条动态附带的点赞人/最新评论预览条数，完整列表走分页接口
+    MOMENT_FEED_LIKE_PREVIEW: int = 20
+    MOMENT_FEED_COMMENT_PREVIEW: int = 20
+
+    # 朋友圈列表响应缓存：memory（进程内）/ redis（使用 REDIS_URL）/ off
+    FEED_CACHE_BACKEND: str = "memory"
+    FEED_CACHE_TTL_SECONDS: float = 5.0
+    FEED_CACHE_MAX_BYTES: int = 16 * 1024 * 1024
+
+    # 列表总数（sessions / moments / 个人时间线）缓存TTL（秒）与条目上限，0 表示每次都执行 COUNT
+    LIST_COUNT_CACHE_TTL_SECONDS: float = 10.0
+    LIST_COUNT_CACHE_MAX_ENTRIES: int = 1024
+
+    # 本地上传图片的data URL缓存容量（字节）
+    IMAGE_DATA_URL_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+
     # 本地开发可用的AI模拟模式（不调用真实Azure OpenAI）
     MOCK_OPENAI: bool = False
 
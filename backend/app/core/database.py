@@ -1,4 +1,7 @@
+from urllib.parse import parse_qsl, urlencode
+
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
@@ -18,9 +21,79 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+
+# libpq 的 sslmode 取值，asyncpg 的 ssl 连接参数可直接接受
+_ASYNCPG_SSL_MODES = {"disable", "allow", "prefer", "require", "verify-ca", "verify-full"}
+
+
+def _is_postgres(url: str) -> bool:
+    return url.partition("://")[0].split("+", 1)[0] in ("postgres", "postgresql")
+
+
+def to_async_database_url(url: str) -> str:
+    """将同步数据库URL转换为异步驱动URL（Postgres→asyncpg，SQLite→aiosqlite）
+
+    asyncpg 不认识 libpq 的 sslmode 查询参数，转换时移除，改由 async_connect_args 传入。
+    """
+    scheme, sep, rest = url.partition("://")
+    if not sep:
+        return url
+
+    if _is_postgres(url):
+        base, _, query = rest.partition("?")
+        params = [(key, value) for key, value in parse_qsl(query, keep_blank_values=True) if key != "sslmode"]
+        return f"postgresql+asyncpg://{base}" + (f"?{urlencode(params)}" if params else "")
+    if scheme.split("+", 1)[0] == "sqlite":
+        return f"sqlite+aiosqlite://{rest}"
+    return url
+
+
+def async_connect_args(url: str) -> dict:
+    """异步引擎的额外连接参数：Postgres URL 中的 sslmode 翻译为 asyncpg 的 ssl 参数"""
+    if not _is_postgres(url):
+        return {}
+    query = url.partition("?")[2]
+    sslmode = dict(parse_qsl(query)).get("sslmode")
+    if sslmode is None:
+        return {}
+    if sslmode not in _ASYNCPG_SSL_MODES:
+        raise ValueError(f"不支持的 sslmode: {sslmode}")
+    return {"ssl": sslmode}
+
+
+ASYNC_DATABASE_URL = to_async_database_url(settings.DATABASE_URL)
+
+if ASYNC_DATABASE_URL.startswith("sqlite"):
+    # aiosqlite 文件库默认使用 NullPool，连接开销很小，无需连接池参数
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, echo=False)
+else:
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        connect_args=async_connect_args(settings.DATABASE_URL),
+        pool_pre_ping=True,
+        pool_size=5,
+        max_overflow=10,
+        pool_timeout=30,
+        pool_recycle=3600,
+        echo=False
+    )
+
+# expire_on_commit=False：提交后仍可读取已加载属性，避免在事件循环中触发隐式IO
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
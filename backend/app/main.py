@@ -1,12 +1,52 @@
+import asyncio
+from contextlib import asynccontextmanager, suppress
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 from app.api.endpoints import chat, upload, sessions, health, moments
 from app.core.config import settings
 from app.middleware import init_error_handlers, init_rate_limit, api_key_middleware as auth_middleware
+from app.services.media_reconciler import media_reconciler
+from app.services.media_resolver import media_resolver
+from app.services.moment_counter_checker import moment_counter_checker
+from app.utils.token_counter import token_counter
 
-app = FastAPI(title="Multimodal Chat API", version="0.1.0")
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # 后台预热tiktoken编码，健康检查无需等待BPE加载
+    if settings.TOKEN_COUNTER_WARMUP:
+        token_counter.warm_up_in_background()
+    # 扫描上传目录建立本地媒体索引
+    media_resolver.rescan_in_background()
+
+    background_tasks = []
+    if settings.MEDIA_RECONCILE_INTERVAL_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(
+            media_reconciler.run_periodically(settings.MEDIA_RECONCILE_INTERVAL_SECONDS)
+        ))
+    if settings.MOMENT_COUNTER_CHECK_INTERVAL_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(
+            moment_counter_checker.run_periodically(settings.MOMENT_COUNTER_CHECK_INTERVAL_SECONDS)
+        ))
+
+    yield
+
+    for task in background_tasks:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+
+
+# 默认用 orjson 编码响应体，比标准库 json 快且原生支持 datetime
+app = FastAPI(
+    title="Multimodal Chat API",
+    version="0.1.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
 
 uploads_dir = Path(settings.LOCAL_UPLOAD_DIR)
 uploads_dir.mkdir(parents=True, exist_ok=True)
@@ -0,0 +1,12 @@
+from sqlalchemy import Column, Integer, String
+
+from app.core.database import Base
+
+
+class ListVersion(Base):
+    """列表的写入计数器：新增/删除条目时在同一事务内 +1，与 max(updated_at) 一起作为 ETag 版本标记"""
+
+    __tablename__ = "list_versions"
+
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0, server_default="0")
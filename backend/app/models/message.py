@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Text, DateTime, ForeignKey, JSON
+from sqlalchemy import Column, String, Text, DateTime, ForeignKey, JSON, Index, Integer
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import uuid
@@ -6,6 +6,10 @@ from app.core.database import Base
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        # 会话历史按 session_id 过滤并按 created_at 排序
+        Index("ix_messages_session_id_created_at", "session_id", "created_at"),
+    )
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     session_id = Column(String, ForeignKey("sessions.id"), nullable=False)
@@ -13,6 +17,7 @@ class Message(Base):
     content = Column(Text, nullable=False)
     image_urls = Column(JSON, nullable=True)
     audio_text = Column(Text, nullable=True)
+    token_count = Column(Integer, nullable=True)  # 写入时计算一次，历史截断直接复用
     created_at = Column(DateTime, default=datetime.utcnow)
 
     session = relationship("Session", back_populates="messages")
\ No newline at end of file
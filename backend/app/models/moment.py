@@ -1,7 +1,7 @@
 from datetime import datetime
 import uuid
 
-from sqlalchemy import Column, DateTime, ForeignKey, String, Text, UniqueConstraint, JSON
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, String, Text, UniqueConstraint, JSON
 from sqlalchemy.orm import relationship
 
 from app.core.database import Base
@@ -9,6 +9,15 @@ from app.core.database import Base
 
 class Moment(Base):
     __tablename__ = "moments"
+    __table_args__ = (
+        Index("ix_moments_created_at_id", "created_at", "id"),
+        # max(updated_at) 作为朋友圈列表的 ETag 版本标记
+        Index("ix_moments_updated_at", "updated_at"),
+        # 个人时间线键集分页与按作者批量改头像；带上 id 使同一时间戳内的排序也由索引给出
+        Index("ix_moments_author_name_created_at", "author_name", "created_at", "id"),
+        # 清空对话时按 session_id 批量解除关联
+        Index("ix_moments_session_id", "session_id"),
+    )
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     author_name = Column(String, nullable=False, default="你")
@@ -17,7 +26,11 @@ class Moment(Base):
     image_urls = Column(JSON, nullable=True)
     location = Column(String, nullable=True)
     session_id = Column(String, ForeignKey("sessions.id"), nullable=True)
+    # 冗余计数，与点赞/评论的增删在同一事务内原子 ±1；moment_counter_checker 定期校对
+    like_count = Column(Integer, nullable=False, default=0, server_default="0")
+    comment_count = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime, default=datetime.utcnow)
+    # 点赞/评论变化时同步刷新，作为列表缓存的版本标记
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     likes = relationship("MomentLike", back_populates="moment", cascade="all, delete-orphan")
@@ -28,6 +41,9 @@ class MomentLike(Base):
     __tablename__ = "moment_likes"
     __table_args__ = (
         UniqueConstraint("moment_id", "user_name", name="uq_moment_like_user"),
+        Index("ix_moment_likes_moment_id_created_at", "moment_id", "created_at"),
+        # 按当前用户批量判断 liked_by_me
+        Index("ix_moment_likes_user_name_moment_id", "user_name", "moment_id"),
     )
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
@@ -40,6 +56,9 @@ class MomentLike(Base):
 
 class MomentComment(Base):
     __tablename__ = "moment_comments"
+    __table_args__ = (
+        Index("ix_moment_comments_moment_id_created_at", "moment_id", "created_at"),
+    )
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     moment_id = Column(String, ForeignKey("moments.id", ondelete="CASCADE"), nullable=False)
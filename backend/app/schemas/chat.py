@@ -20,9 +20,12 @@ class SessionResponse(BaseModel):
 
 class SessionsResponse(BaseModel):
     sessions: List[SessionResponse]
-    total: int
+    # include_total=false 时为 None
+    total: Optional[int] = None
     page: int
     limit: int
+    has_more: bool = False
+    next_cursor: Optional[str] = None
 
 
 class ClearSessionsResponse(BaseModel):
@@ -51,10 +51,26 @@ class MomentResponse(BaseModel):
 
 class MomentsListResponse(BaseModel):
     moments: List[MomentResponse]
-    total: int
+    # include_total=false 时为 None
+    total: Optional[int] = None
     page: int
     limit: int
     has_more: bool
+    next_cursor: Optional[str] = None
+
+
+class MomentCommentsPageResponse(BaseModel):
+    moment_id: str
+    comments: List[MomentCommentResponse]
+    has_more: bool
+    next_cursor: Optional[str] = None
+
+
+class MomentLikesPageResponse(BaseModel):
+    moment_id: str
+    likes: List[str]
+    has_more: bool
+    next_cursor: Optional[str] = None
 
 
 class MomentLikeToggleResponse(BaseModel):
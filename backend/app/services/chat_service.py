@@ -1,21 +1,34 @@
-from typing import List, Optional, AsyncGenerator, Dict
+from typing import List, Optional, AsyncGenerator, Callable, Dict, Tuple
 import logging
 from datetime import datetime
-from pathlib import Path
-from urllib.parse import urlparse, unquote
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from app.models.session import Session as SessionModel
 from app.models.message import Message as MessageModel
 from app.models.moment import Moment as MomentModel
-from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.services.count_cache import SESSIONS_COUNT_KEY, list_count_cache
+from app.services.history_cache import SessionHistoryCache, session_history_cache
+from app.services.feed_cache import invalidate_feed
+from app.services.list_versions import MOMENTS_LIST, SESSIONS_LIST, bump_list_version, get_list_version
+from app.services.media_resolver import media_resolver
 from app.services.openai_service import openai_service
+from app.utils.pagination import encode_cursor, keyset_before
 from app.utils.token_counter import token_counter
 
 logger = logging.getLogger(__name__)
 
 class ChatService:
-    def __init__(self, db: Session):
+    def __init__(
+        self,
+        db: Optional[AsyncSession] = None,
+        session_factory: async_sessionmaker = AsyncSessionLocal,
+        history_cache: Optional[SessionHistoryCache] = session_history_cache
+    ):
         self.db = db
+        self.session_factory = session_factory
+        self.history_cache = history_cache
 
     async def process_chat(
         self,
@@ -24,107 +37,278 @@ class ChatService:
         image_urls: Optional[List[str]] = None,
         audio_text: Optional[str] = None
     ) -> AsyncGenerator[str, None]:
-        """处理聊天请求，流式返回AI响应"""
+        """处理聊天请求，流式返回AI响应
+
+        每个阶段使用独立的短事务，流式输出期间不占用连接池中的数据库连接。
+        """
 
         try:
             sanitized_image_urls = self._sanitize_image_urls(image_urls)
 
-            # 获取或创建会话
-            session = self._get_or_create_session(session_id)
-            yield f"session:{session.id}"
-
-            # 维护会话元数据
-            session.updated_at = datetime.utcnow()
-            if not session.title and user_message:
-                session.title = self._generate_title(user_message)
-            self.db.add(session)
-
-            # 保存用户消息
-            user_msg = MessageModel(
-                session_id=session.id,
-                role="user",
-                content=user_message,
-                image_urls=sanitized_image_urls,
-                audio_text=audio_text
-            )
-            self.db.add(user_msg)
-            self.db.commit()
-
-            # 获取会话历史
-            history = self._get_session_history(session.id)
-
-            # 流式调用AI
+            # 阶段1：获取或创建会话，维护元数据并保存用户消息
+            async with self.session_factory() as db:
+                session = await self._get_or_create_session(db, session_id)
+                if session.id != session_id:
+                    await bump_list_version(db, SESSIONS_LIST)
+                now = datetime.utcnow()
+                session.updated_at = now
+                session.last_message_at = now
+                session.message_count = SessionModel.message_count + 1
+                if not session.title and user_message:
+                    session.title = self._generate_title(user_message)
+                if not session.preview_image_url and sanitized_image_urls:
+                    session.preview_image_url = sanitized_image_urls[0]
+
+                user_entry = await self._history_entry("user", user_message, sanitized_image_urls, audio_text)
+                db.add(MessageModel(session_id=session.id, **user_entry))
+                await db.commit()
+                current_session_id = session.id
+
+            if current_session_id != session_id:
+                # 新建会话：历史即为刚写入的这一条
+                self._cache_fill(current_session_id, [user_entry])
+                list_count_cache.invalidate(SESSIONS_COUNT_KEY)
+            else:
+                self._cache_append(current_session_id, user_entry)
+
+            yield f"session:{current_session_id}"
+
+            # 阶段2：获取会话历史
+            async with self.session_factory() as db:
+                history, history_tokens = await self._get_session_history(db, current_session_id)
+
+            # 流式调用AI（不持有数据库连接）
             full_response = ""
-            async for chunk in openai_service.chat_completion_stream(history):
+            async for chunk in openai_service.chat_completion_stream(history, input_tokens=history_tokens):
                 yield chunk
                 full_response += chunk
 
-            # 保存AI响应
-            ai_msg = MessageModel(
-                session_id=session.id,
-                role="assistant",
-                content=full_response
-            )
-            session.updated_at = datetime.utcnow()
-            self.db.add(ai_msg)
-            self.db.add(session)
-            self.db.commit()
+            # 阶段3：保存AI响应
+            assistant_entry = await self._history_entry("assistant", full_response)
+            async with self.session_factory() as db:
+                db.add(MessageModel(session_id=current_session_id, **assistant_entry))
+                now = datetime.utcnow()
+                await db.execute(
+                    update(SessionModel)
+                    .where(SessionModel.id == current_session_id)
+                    .values(
+                        updated_at=now,
+                        last_message_at=now,
+                        message_count=SessionModel.message_count + 1
+                    )
+                )
+                await db.commit()
+            self._cache_append(current_session_id, assistant_entry)
 
         except Exception as e:
             logger.error(f"聊天处理错误: {str(e)}", exc_info=True)
             yield f"系统错误: {str(e)}"
 
-    def _get_or_create_session(self, session_id: Optional[str]) -> SessionModel:
-        """获取或创建会话"""
+    async def _get_or_create_session(self, db: AsyncSession, session_id: Optional[str]) -> SessionModel:
+        """获取或创建会话（由调用方负责提交）"""
         if session_id:
-            session = self.db.query(SessionModel).filter(SessionModel.id == session_id).first()
+            session = await db.get(SessionModel, session_id)
             if session:
                 return session
 
         # 创建新会话
         session = SessionModel()
-        self.db.add(session)
-        self.db.commit()
+        db.add(session)
+        await db.flush()
         return session
 
-    def _get_session_history(self, session_id: str, max_messages: int = 30, max_tokens: int = 120000) -> List[dict]:
-        """获取会话历史消息，使用token计数和消息数量双重限制防止token超限"""
-        # 首先按时间倒序获取消息，限制数量
-        messages = self.db.query(MessageModel).filter(
-            MessageModel.session_id == session_id
-        ).order_by(MessageModel.created_at.desc()).limit(max_messages).all()
-
-        # 反转顺序，保持时间顺序
-        messages = list(reversed(messages))
-
-        # 转换为字典格式
-        history = []
-        for msg in messages:
-            sanitized_image_urls = self._sanitize_image_urls(msg.image_urls)
-            history.append({
-                "role": msg.role,
-                "content": msg.content,
-                "image_urls": sanitized_image_urls,
-                "audio_text": msg.audio_text
-            })
-
-        # 使用token计数器进行智能截断
-        truncated_history = token_counter.truncate_messages(
+    @staticmethod
+    async def _history_entry(
+        role: str,
+        content: str,
+        image_urls: Optional[List[str]] = None,
+        audio_text: Optional[str] = None
+    ) -> dict:
+        """构造待写入消息的字段（同时作为历史缓存条目），token数量只在此计算一次"""
+        entry = {
+            "role": role,
+            "content": content,
+            "image_urls": image_urls,
+            "audio_text": audio_text,
+        }
+        entry["token_count"] = await token_counter.run_async(token_counter.count_message_tokens, entry)
+        return entry
+
+    def _cache_fill(self, session_id: str, entries: List[dict]) -> None:
+        if self.history_cache is not None:
+            self.history_cache.fill(session_id, entries)
+
+    def _cache_append(self, session_id: str, entry: dict) -> None:
+        if self.history_cache is not None:
+            self.history_cache.append(session_id, entry)
+
+    @staticmethod
+    def _history_query(session_id: str, max_messages: int):
+        """最近N条消息查询，由 ix_messages_session_id_created_at 支撑"""
+        return (
+            select(MessageModel)
+            .where(MessageModel.session_id == session_id)
+            .order_by(MessageModel.created_at.desc())
+            .limit(max_messages)
+        )
+
+    async def _get_session_history(
+        self,
+        db: AsyncSession,
+        session_id: str,
+        max_messages: int = 30,
+        max_tokens: int = 120000
+    ) -> Tuple[List[dict], int]:
+        """获取会话历史消息，使用token计数和消息数量双重限制防止token超限
+
+        返回 (历史消息, 历史token总数)。命中进程内历史缓存时不查询数据库。
+        """
+        use_cache = self.history_cache is not None and max_messages <= self.history_cache.max_messages
+        history = self.history_cache.get(session_id) if use_cache else None
+
+        if history is None:
+            # 首先按时间倒序获取消息，限制数量
+            result = await db.execute(self._history_query(session_id, max_messages))
+            messages = result.scalars().all()
+
+            # 反转顺序，保持时间顺序，转换为字典格式
+            history = [
+                {
+                    "role": msg.role,
+                    "content": msg.content,
+                    "image_urls": self._sanitize_image_urls(msg.image_urls),
+                    "audio_text": msg.audio_text,
+                    "token_count": msg.token_count
+                }
+                for msg in reversed(messages)
+            ]
+            pending = [
+                (msg.id, entry)
+                for msg, entry in zip(reversed(messages), history)
+                if entry["token_count"] is None
+            ]
+            if pending:
+                await self._persist_token_counts(db, pending)
+            if use_cache:
+                self.history_cache.fill(session_id, history)
+
+        # 使用token计数器进行智能截断，同时得到保留消息的token总数
+        return await token_counter.run_async(
+            token_counter.truncate_messages_with_total,
             history,
             max_tokens=max_tokens,
             max_messages=max_messages
         )
 
-        return truncated_history
+    @staticmethod
+    async def _persist_token_counts(db: AsyncSession, pending: List[Tuple[str, dict]]) -> None:
+        """回写迁移未能回填的旧消息token数量，之后的轮次直接复用，不再重复编码"""
+        entries = [entry for _, entry in pending]
+        counts = await token_counter.run_async(token_counter.count_messages_tokens, entries)
+        for entry, count in zip(entries, counts):
+            entry["token_count"] = count
 
-    def get_sessions(self, page: int = 1, limit: int = 20):
-        """获取对话列表"""
-        offset = (page - 1) * limit
-        sessions = self.db.query(SessionModel).order_by(
-            SessionModel.updated_at.desc()
-        ).offset(offset).limit(limit).all()
+        try:
+            await db.execute(
+                update(MessageModel),
+                [{"id": message_id, "token_count": entry["token_count"]} for message_id, entry in pending]
+            )
+            await db.commit()
+        except SQLAlchemyError as exc:
+            await db.rollback()
+            logger.warning("回写消息token数量失败: %s", exc)
+
+    @staticmethod
+    def _sessions_query(limit: int, offset: int = 0, cursor: Optional[str] = None):
+        """会话列表查询：(updated_at, id) 倒序；有游标时走键集定位，否则兼容 OFFSET"""
+        query = (
+            select(SessionModel)
+            .order_by(SessionModel.updated_at.desc(), SessionModel.id.desc())
+            .limit(limit)
+        )
+        if cursor:
+            return query.where(keyset_before(SessionModel.updated_at, SessionModel.id, cursor))
+        return query.offset(offset)
+
+    @staticmethod
+    async def first_available_images(db: AsyncSession, session_ids: List[str]) -> Dict[str, Optional[str]]:
+        """按消息时间顺序找出各会话中第一张仍存在的图片，作为会话预览图；没有则为 None
+
+        每轮用 row_number() 只取各会话的下一条带图消息（rn = 1 起逐轮后移），
+        只有候选图片也已失效的会话才进入下一轮，不读取会话的全部图片消息。
+        """
+        previews: Dict[str, Optional[str]] = {session_id: None for session_id in session_ids}
+        pending = set(session_ids)
+        rank = 0
+        while pending:
+            rank += 1
+            ranked = (
+                select(
+                    MessageModel.session_id,
+                    MessageModel.image_urls,
+                    func.row_number().over(
+                        partition_by=MessageModel.session_id,
+                        order_by=(MessageModel.created_at, MessageModel.id)
+                    ).label("rn"),
+                )
+                .where(MessageModel.session_id.in_(pending), MessageModel.image_urls.isnot(None))
+                .subquery()
+            )
+            result = await db.execute(
+                select(ranked.c.session_id, ranked.c.image_urls).where(ranked.c.rn == rank)
+            )
+            candidates = dict(result.all())
+            for session_id, image_urls in candidates.items():
+                images = media_resolver.sanitize_image_urls(image_urls)
+                if images:
+                    previews[session_id] = images[0]
+                    pending.discard(session_id)
+            # 没有更多带图消息的会话到此为止
+            pending.intersection_update(candidates)
+        return previews
+
+    async def get_sessions_version(self) -> Tuple[Optional[datetime], int]:
+        """会话列表的版本标记：max(updated_at) 走索引，新增/删除由写入计数器反映，均无需 COUNT(*)"""
+        latest = await self.db.scalar(select(func.max(SessionModel.updated_at)))
+        version = await get_list_version(self.db, SESSIONS_LIST)
+        return latest, version
+
+    async def _count_sessions(self) -> int:
+        return await list_count_cache.get_or_load(
+            SESSIONS_COUNT_KEY,
+            lambda: self.db.scalar(select(func.count()).select_from(SessionModel))
+        )
 
-        total = self.db.query(SessionModel).count()
+    async def get_sessions(
+        self,
+        page: int = 1,
+        limit: int = 20,
+        cursor: Optional[str] = None,
+        include_total: bool = True
+    ):
+        """获取对话列表；传入 cursor 时按 (updated_at, id) 键集分页，忽略 page"""
+        # 多取一行用于判断是否还有下一页
+        result = await self.db.execute(self._sessions_query(
+            limit + 1, offset=(page - 1) * limit, cursor=cursor
+        ))
+        sessions = result.scalars().all()
+        has_more = len(sessions) > limit
+        sessions = sessions[:limit]
+        next_cursor = encode_cursor(sessions[-1].updated_at, sessions[-1].id) if has_more else None
+
+        total = await self._count_sessions() if include_total else None
+
+        previews = {
+            session.id: media_resolver.sanitize_media_url(session.preview_image_url)
+            for session in sessions
+        }
+        # 存储的预览图已失效：本页内一次查询改用第一张仍存在的图片，落库修复由 media_reconciler 完成
+        stale_ids = [
+            session.id for session in sessions
+            if session.preview_image_url and previews[session.id] is None
+        ]
+        if stale_ids:
+            previews.update(await self.first_available_images(self.db, stale_ids))
 
         return {
             "sessions": [
@@ -132,56 +316,112 @@ class ChatService:
                     "id": session.id,
                     "title": session.title or f"对话 {session.id[:8]}",
                     "created_at": session.created_at.isoformat(),
-                    "message_count": len(session.messages),
-                    "preview_image": self._get_session_preview(session)
+                    "message_count": session.message_count,
+                    "preview_image": previews[session.id]
                 }
                 for session in sessions
             ],
             "total": total,
             "page": page,
-            "limit": limit
+            "limit": limit,
+            "has_more": has_more,
+            "next_cursor": next_cursor
         }
 
-    def clear_sessions(self) -> Dict[str, int]:
-        """清空全部对话，并解除朋友圈对话关联。"""
-        sessions = self.db.query(SessionModel).all()
-        if not sessions:
-            return {
-                "deleted_sessions": 0,
-                "deleted_messages": 0,
-                "detached_moments": 0,
-            }
-
-        session_ids = [session.id for session in sessions]
-        deleted_messages = self.db.query(MessageModel).filter(
-            MessageModel.session_id.in_(session_ids)
-        ).count()
-
+    async def clear_sessions(
+        self,
+        batch_size: int = 500,
+        message_batch_size: int = 5000,
+        on_progress: Optional[Callable[[Dict[str, int]], None]] = None
+    ) -> Dict[str, int]:
+        """清空全部对话，并解除朋友圈对话关联。
+
+        按会话 id 分批执行集合式 UPDATE/DELETE，每批独立提交：
+        先解除朋友圈关联，再分块删除消息，最后删除会话；不加载 ORM 对象。
+        """
+        progress = {
+            "deleted_sessions": 0,
+            "deleted_messages": 0,
+            "detached_moments": 0,
+        }
+        last_id = ""
         try:
-            detached_moments = self.db.query(MomentModel).filter(
-                MomentModel.session_id.in_(session_ids)
-            ).update({MomentModel.session_id: None}, synchronize_session=False)
-
-            for session in sessions:
-                self.db.delete(session)
-
-            self.db.commit()
-            return {
-                "deleted_sessions": len(session_ids),
-                "deleted_messages": deleted_messages,
-                "detached_moments": detached_moments,
-            }
+            while True:
+                session_ids = (await self.db.execute(
+                    select(SessionModel.id)
+                    .where(SessionModel.id > last_id)
+                    .order_by(SessionModel.id)
+                    .limit(batch_size)
+                )).scalars().all()
+                if not session_ids:
+                    break
+                last_id = session_ids[-1]
+
+                detach_result = await self.db.execute(
+                    update(MomentModel)
+                    .where(MomentModel.session_id.in_(session_ids))
+                    .values(session_id=None)
+                    .execution_options(synchronize_session=False)
+                )
+                progress["detached_moments"] += detach_result.rowcount
+                if detach_result.rowcount:
+                    # 动态列表展示 session_id：刷新 ETag 版本并失效已缓存的列表页
+                    await bump_list_version(self.db, MOMENTS_LIST)
+                await self.db.commit()
+                if detach_result.rowcount:
+                    await invalidate_feed()
+
+                progress["deleted_messages"] += await self._delete_session_messages(
+                    session_ids, message_batch_size
+                )
+
+                delete_result = await self.db.execute(
+                    delete(SessionModel)
+                    .where(SessionModel.id.in_(session_ids))
+                    .execution_options(synchronize_session=False)
+                )
+                progress["deleted_sessions"] += delete_result.rowcount
+                await bump_list_version(self.db, SESSIONS_LIST)
+                await self.db.commit()
+
+                if self.history_cache is not None:
+                    for cleared_id in session_ids:
+                        self.history_cache.invalidate(cleared_id)
+                logger.info(
+                    "清空对话进度: 会话 %d, 消息 %d, 解除朋友圈关联 %d",
+                    progress["deleted_sessions"],
+                    progress["deleted_messages"],
+                    progress["detached_moments"],
+                )
+                if on_progress is not None:
+                    on_progress(dict(progress))
         except Exception:
-            self.db.rollback()
+            await self.db.rollback()
             raise
-
-    def _get_session_preview(self, session: SessionModel) -> Optional[str]:
-        """获取会话预览图"""
-        for message in session.messages:
-            sanitized = self._sanitize_image_urls(message.image_urls)
-            if sanitized:
-                return sanitized[0]
-        return None
+        finally:
+            list_count_cache.invalidate(SESSIONS_COUNT_KEY)
+
+        return progress
+
+    async def _delete_session_messages(self, session_ids: List[str], batch_size: int) -> int:
+        """按消息 id 分块删除指定会话的消息，每块独立提交，返回删除总数"""
+        deleted = 0
+        while True:
+            message_ids = (await self.db.execute(
+                select(MessageModel.id)
+                .where(MessageModel.session_id.in_(session_ids))
+                .limit(batch_size)
+            )).scalars().all()
+            if not message_ids:
+                return deleted
+
+            await self.db.execute(
+                delete(MessageModel)
+                .where(MessageModel.id.in_(message_ids))
+                .execution_options(synchronize_session=False)
+            )
+            await self.db.commit()
+            deleted += len(message_ids)
 
     def _generate_title(self, content: str, max_length: int = 40) -> str:
         """基于首条用户消息生成对话标题"""
@@ -190,58 +430,5 @@ class ChatService:
             return "新对话"
         return normalized[:max_length]
 
-    def _extract_local_upload_relative_path(self, url: str) -> Optional[str]:
-        if not url:
-            return None
-
-        stripped = url.strip()
-        if not stripped:
-            return None
-
-        if stripped.startswith("/uploads/"):
-            return stripped[len("/uploads/"):].lstrip("/")
-
-        try:
-            parsed = urlparse(stripped)
-        except Exception:
-            return None
-
-        if parsed.path.startswith("/uploads/"):
-            return unquote(parsed.path[len("/uploads/"):].lstrip("/"))
-
-        return None
-
-    def _local_upload_exists(self, url: str) -> Optional[bool]:
-        relative_path = self._extract_local_upload_relative_path(url)
-        if relative_path is None:
-            return None
-
-        candidate = Path(relative_path)
-        if candidate.is_absolute() or ".." in candidate.parts:
-            return False
-
-        upload_root = Path(settings.LOCAL_UPLOAD_DIR).resolve()
-        target = (upload_root / candidate).resolve()
-        if upload_root not in target.parents and target != upload_root:
-            return False
-
-        return target.exists()
-
     def _sanitize_image_urls(self, image_urls: Optional[List[str]]) -> Optional[List[str]]:
-        if not image_urls:
-            return None
-
-        sanitized: List[str] = []
-        for raw in image_urls:
-            normalized = (raw or "").strip()
-            if not normalized:
-                continue
-
-            exists = self._local_upload_exists(normalized)
-            if exists is False:
-                logger.warning("Skip missing local image URL: %s", normalized)
-                continue
-
-            sanitized.append(normalized)
-
-        return sanitized or None
+        return media_resolver.sanitize_image_urls(image_urls) or None
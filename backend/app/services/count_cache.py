@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from app.core.config import settings
+
+SESSIONS_COUNT_KEY = "sessions"
+MOMENTS_COUNT_KEY = "moments"
+
+
+def moment_author_count_key(author_name: str) -> str:
+    """个人时间线的动态总数键"""
+    return f"{MOMENTS_COUNT_KEY}:author:{author_name}"
+
+
+class CountCache:
+    """列表总数的短TTL缓存
+
+    命中时跳过 COUNT(*)，本进程内的新增/删除路径主动失效对应键；
+    其它进程的写入最多在 ttl_seconds 后可见。ttl_seconds<=0 时不缓存。
+    个人时间线按任意作者名建键，因此按 LRU 限制条目数，过期条目在访问时移除。
+    """
+
+    def __init__(self, ttl_seconds: float = 10.0, max_entries: int = 1024):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[int]]) -> int:
+        now = time.monotonic()
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None and item[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return item[0]
+            if item is not None:
+                del self._entries[key]
+            self.misses += 1
+
+        value = int(await loader() or 0)
+        if self.ttl_seconds > 0 and self.max_entries > 0:
+            with self._lock:
+                self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        """失效单个键；不传 key 时清空全部"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "keys": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+list_count_cache = CountCache(
+    ttl_seconds=settings.LIST_COUNT_CACHE_TTL_SECONDS,
+    max_entries=settings.LIST_COUNT_CACHE_MAX_ENTRIES,
+)
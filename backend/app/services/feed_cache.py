@@ -0,0 +1,255 @@
+import logging
+import threading
+import time
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.utils.byte_lru import ByteLRUCache
+
+
+logger = logging.getLogger(__name__)
+
+# 每个缓存条目除正文外的固定开销估算（键、ETag、元组）
+_ENTRY_OVERHEAD_BYTES = 256
+
+
+class InProcessFeedBackend:
+    """进程内后端：ByteLRUCache 存 (正文, ETag, 过期时间, 动态id)，另维护 动态id → 缓存键 的反向索引
+
+    条目被淘汰、过期或失效时同步从反向索引中移除，索引大小随缓存条目受 max_bytes 约束。
+    """
+
+    def __init__(self, max_bytes: int):
+        self._entries = ByteLRUCache(max_bytes=max_bytes, on_evict=self._unindex_entry)
+        self._keys_by_moment: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def _unindex_entry(self, key: str, item: Tuple) -> None:
+        with self._lock:
+            for moment_id in item[3]:
+                keys = self._keys_by_moment.get(moment_id)
+                if keys is None:
+                    continue
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_moment[moment_id]
+
+    async def generation(self) -> Optional[int]:
+        # 进程内后端的失效由 FeedCache.epoch 覆盖
+        return None
+
+    def _drop(self, key: str) -> None:
+        item = self._entries.pop(key)
+        if item is not None:
+            self._unindex_entry(key, item)
+
+    async def get(self, key: str) -> Optional[Tuple[bytes, str]]:
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        body, etag, expires_at, _moment_ids = item
+        if expires_at <= time.monotonic():
+            self._drop(key)
+            return None
+        return body, etag
+
+    async def put(
+        self,
+        key: str,
+        body: bytes,
+        etag: str,
+        moment_ids: Iterable[str],
+        ttl_seconds: float,
+        generation: Optional[int] = None,
+    ) -> None:
+        # 覆盖旧条目前先清掉它的索引，旧页可能包含不同的动态
+        self._drop(key)
+        moment_ids = tuple(moment_ids)
+        item = (body, etag, time.monotonic() + ttl_seconds, moment_ids)
+        if not self._entries.put(key, item, len(body) + _ENTRY_OVERHEAD_BYTES):
+            return
+        with self._lock:
+            for moment_id in moment_ids:
+                self._keys_by_moment.setdefault(moment_id, set()).add(key)
+
+    async def invalidate_moment(self, moment_id: str) -> None:
+        with self._lock:
+            keys = self._keys_by_moment.pop(moment_id, set())
+        for key in keys:
+            # 同一页还登记在其它动态下，一并清理
+            self._drop(key)
+
+    async def invalidate_all(self) -> None:
+        with self._lock:
+            self._keys_by_moment.clear()
+        self._entries.clear()
+
+    def stats(self) -> Dict:
+        stats = self._entries.stats()
+        with self._lock:
+            stats["indexed_moments"] = len(self._keys_by_moment)
+        return stats
+
+
+class RedisFeedBackend:
+    """Redis 后端：多进程共享；全量失效通过递增代际号实现，单条动态失效通过 tag 集合精确删除
+
+    写回使用构建响应前读到的代际号：期间其它进程做过全量失效时，旧页写入已废弃的代际，
+    读取不可见。单条动态的跨进程失效没有代际保护，与之并发构建的旧页最多存活一个TTL。
+    """
+
+    _GENERATION_KEY = "feed:generation"
+
+    def __init__(self, redis_url: str):
+        import redis.asyncio as redis_asyncio
+
+        self._redis = redis_asyncio.from_url(redis_url, socket_timeout=5, socket_connect_timeout=5)
+
+    async def generation(self) -> Optional[int]:
+        return int(await self._redis.get(self._GENERATION_KEY) or 0)
+
+    async def get(self, key: str) -> Optional[Tuple[bytes, str]]:
+        generation = await self.generation()
+        body, etag = await self._redis.hmget(f"feed:{generation}:{key}", "body", "etag")
+        if body is None or etag is None:
+            return None
+        return body, etag.decode("ascii")
+
+    async def put(
+        self,
+        key: str,
+        body: bytes,
+        etag: str,
+        moment_ids: Iterable[str],
+        ttl_seconds: float,
+        generation: Optional[int] = None,
+    ) -> None:
+        if generation is None:
+            return
+        full_key = f"feed:{generation}:{key}"
+        ttl_ms = max(int(ttl_seconds * 1000), 1)
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.hset(full_key, mapping={"body": body, "etag": etag})
+            pipe.pexpire(full_key, ttl_ms)
+            for moment_id in moment_ids:
+                tag_key = f"feed:tag:{moment_id}"
+                pipe.sadd(tag_key, full_key)
+                pipe.pexpire(tag_key, ttl_ms)
+            await pipe.execute()
+
+    async def invalidate_moment(self, moment_id: str) -> None:
+        tag_key = f"feed:tag:{moment_id}"
+        keys = await self._redis.smembers(tag_key)
+        await self._redis.delete(tag_key, *keys)
+
+    async def invalidate_all(self) -> None:
+        await self._redis.incr(self._GENERATION_KEY)
+
+    def stats(self) -> Dict:
+        return {"backend": "redis"}
+
+
+class FeedCache:
+    """朋友圈列表响应缓存
+
+    以 (page/cursor, limit, include_total, me, author) 为键缓存已序列化的 JSON 正文与 ETag，短TTL兜底。
+    点赞、评论只失效包含该动态的页；发布、删除、批量改头像会改变分页或多条动态，失效全部。
+    后端异常时视为未命中，不影响请求。
+    """
+
+    def __init__(self, backend, ttl_seconds: float):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        # 本进程每次失效递增；构建响应前记录，写回时若已变化说明期间有写入，放弃缓存。
+        # epoch 只覆盖本进程的写入，其它进程的全量失效由后端代际号（见 snapshot）识别
+        self.epoch = 0
+
+    @staticmethod
+    def make_key(
+        page: int, cursor: Optional[str], limit: int, include_total: bool, me: str, author: Optional[str] = None
+    ) -> str:
+        return f"{cursor or f'page:{page}'}|{limit}|{int(include_total)}|{me}|{author or ''}"
+
+    async def get(self, key: str) -> Optional[Tuple[bytes, str]]:
+        try:
+            item = await self.backend.get(key)
+        except Exception as exc:
+            logger.warning("Feed cache get failed: %s", exc)
+            item = None
+        if item is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return item
+
+    async def snapshot(self) -> Tuple[int, Optional[int]]:
+        """构建响应前记录 (本进程 epoch, 后端代际号)，作为 put 的写回条件"""
+        try:
+            generation = await self.backend.generation()
+        except Exception as exc:
+            logger.warning("Feed cache generation lookup failed: %s", exc)
+            generation = None
+        return self.epoch, generation
+
+    async def put(
+        self, key: str, body: bytes, etag: str, moment_ids: Iterable[str], snapshot: Tuple[int, Optional[int]]
+    ) -> None:
+        epoch, generation = snapshot
+        if epoch != self.epoch:
+            return
+        try:
+            await self.backend.put(key, body, etag, list(moment_ids), self.ttl_seconds, generation)
+        except Exception as exc:
+            logger.warning("Feed cache put failed: %s", exc)
+
+    async def invalidate_moment(self, moment_id: str) -> None:
+        self.epoch += 1
+        try:
+            await self.backend.invalidate_moment(moment_id)
+        except Exception as exc:
+            logger.warning("Feed cache invalidation failed: %s", exc)
+
+    async def invalidate_all(self) -> None:
+        self.epoch += 1
+        try:
+            await self.backend.invalidate_all()
+        except Exception as exc:
+            logger.warning("Feed cache invalidation failed: %s", exc)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            **self.backend.stats(),
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def _build_feed_cache() -> Optional[FeedCache]:
+    backend_name = settings.FEED_CACHE_BACKEND.lower()
+    if backend_name == "redis":
+        backend = RedisFeedBackend(settings.REDIS_URL)
+    elif backend_name == "memory":
+        backend = InProcessFeedBackend(max_bytes=settings.FEED_CACHE_MAX_BYTES)
+    else:
+        return None
+    return FeedCache(backend, ttl_seconds=settings.FEED_CACHE_TTL_SECONDS)
+
+
+feed_cache = _build_feed_cache()
+
+
+async def invalidate_feed_moment(moment_id: str) -> None:
+    """单条动态的点赞/评论变化：只失效包含它的列表页"""
+    if feed_cache is not None:
+        await feed_cache.invalidate_moment(moment_id)
+
+
+async def invalidate_feed() -> None:
+    """发布、删除或批量修改动态：失效全部列表页"""
+    if feed_cache is not None:
+        await feed_cache.invalidate_all()
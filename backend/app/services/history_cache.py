@@ -0,0 +1,124 @@
+import threading
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional
+
+from app.core.config import settings
+
+# 每条历史记录的固定开销估算（dict 与各字段对象）
+_ENTRY_OVERHEAD_BYTES = 256
+
+
+def _estimate_entry_bytes(entry: Dict) -> int:
+    size = _ENTRY_OVERHEAD_BYTES
+    size += len(entry.get("content") or "")
+    size += len(entry.get("audio_text") or "")
+    size += sum(len(url) for url in entry.get("image_urls") or [])
+    return size
+
+
+class _SessionHistory:
+    __slots__ = ("entries", "bytes")
+
+    def __init__(self, max_messages: int):
+        self.entries: Deque[Dict] = deque(maxlen=max_messages)
+        self.bytes = 0
+
+
+class SessionHistoryCache:
+    """进程内会话历史缓存
+
+    每个会话保留最近 max_messages 条历史消息（已转换为模型输入字典），
+    首次读取时由数据库填充，之后随新消息写入追加；按会话数与总字节数做LRU淘汰。
+    仅对本进程的写入可见，多进程部署时其它进程的写入不会同步到这里。
+    """
+
+    def __init__(self, max_sessions: int = 1000, max_bytes: int = 32 * 1024 * 1024, max_messages: int = 30):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.max_messages = max_messages
+        self.hits = 0
+        self.misses = 0
+        self._sessions: "OrderedDict[str, _SessionHistory]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Optional[List[Dict]]:
+        """返回按时间顺序排列的历史副本；未缓存时返回 None"""
+        with self._lock:
+            history = self._sessions.get(session_id)
+            if history is None:
+                self.misses += 1
+                return None
+            self._sessions.move_to_end(session_id)
+            self.hits += 1
+            return list(history.entries)
+
+    def fill(self, session_id: str, entries: List[Dict]) -> None:
+        """用数据库读取的最近历史（按时间顺序）填充会话缓存"""
+        with self._lock:
+            self._discard(session_id)
+            history = _SessionHistory(self.max_messages)
+            self._sessions[session_id] = history
+            for entry in entries:
+                self._append(history, entry)
+            self._evict()
+
+    def append(self, session_id: str, entry: Dict) -> None:
+        """追加新写入的消息；会话未缓存时忽略，等待下次读取时完整填充"""
+        with self._lock:
+            history = self._sessions.get(session_id)
+            if history is None:
+                return
+            self._sessions.move_to_end(session_id)
+            self._append(history, entry)
+            self._evict()
+
+    def invalidate(self, session_id: Optional[str] = None) -> None:
+        """失效单个会话；不传 session_id 时清空全部缓存"""
+        with self._lock:
+            if session_id is None:
+                self._sessions.clear()
+                self._bytes = 0
+            else:
+                self._discard(session_id)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "sessions": len(self._sessions),
+                "bytes": self._bytes,
+                "max_sessions": self.max_sessions,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def _append(self, history: _SessionHistory, entry: Dict) -> None:
+        if len(history.entries) == history.entries.maxlen:
+            dropped = _estimate_entry_bytes(history.entries[0])
+            history.bytes -= dropped
+            self._bytes -= dropped
+        history.entries.append(entry)
+        added = _estimate_entry_bytes(entry)
+        history.bytes += added
+        self._bytes += added
+
+    def _discard(self, session_id: str) -> None:
+        history = self._sessions.pop(session_id, None)
+        if history is not None:
+            self._bytes -= history.bytes
+
+    def _evict(self) -> None:
+        while self._sessions and (
+            len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes
+        ):
+            _, history = self._sessions.popitem(last=False)
+            self._bytes -= history.bytes
+
+
+session_history_cache = SessionHistoryCache(
+    max_sessions=settings.HISTORY_CACHE_MAX_SESSIONS,
+    max_bytes=settings.HISTORY_CACHE_MAX_BYTES,
+) if settings.HISTORY_CACHE_ENABLED else None
@@ -0,0 +1,80 @@
+import logging
+import os
+import uuid
+from pathlib import Path
+
+from PIL import Image, ImageOps
+
+from app.core.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+# 已是有损压缩格式的小图无需再生成变体
+_PASSTHROUGH_FORMATS = {"JPEG", "WEBP"}
+_VARIANT_MARKER = ".prompt-"
+
+
+class ImageVariantService:
+    """为本地上传图片生成用于模型输入的缩小版变体，缓存在原图同目录"""
+
+    def __init__(
+        self,
+        max_side: int = 1024,
+        image_format: str = "JPEG",
+        quality: int = 85,
+    ):
+        self.max_side = max_side
+        self.image_format = image_format.upper()
+        self.quality = quality
+        self.extension = ".webp" if self.image_format == "WEBP" else ".jpg"
+
+    def variant_path(self, original: Path) -> Path:
+        return original.with_name(f"{original.stem}{_VARIANT_MARKER}{self.max_side}{self.extension}")
+
+    @staticmethod
+    def is_variant(path: Path) -> bool:
+        return _VARIANT_MARKER in path.name
+
+    def get_prompt_image(self, original: Path) -> Path:
+        """返回用于模型输入的图片路径；无法生成变体时回退原图"""
+        try:
+            variant = self.variant_path(original)
+            if variant.exists() and variant.stat().st_mtime_ns >= original.stat().st_mtime_ns:
+                return variant
+            return self._build_variant(original, variant)
+        except Exception as exc:
+            logger.warning("Failed to build prompt image variant for %s: %s", original, exc)
+            return original
+
+    def _build_variant(self, original: Path, variant: Path) -> Path:
+        with Image.open(original) as image:
+            if image.format in _PASSTHROUGH_FORMATS and max(image.size) <= self.max_side:
+                return original
+
+            # 动图只取首帧；按EXIF方向校正后等比缩放
+            image.seek(0)
+            converted = ImageOps.exif_transpose(image)
+            converted.thumbnail((self.max_side, self.max_side), Image.Resampling.LANCZOS)
+
+            if self.image_format == "JPEG" and converted.mode not in ("RGB", "L"):
+                rgba = converted.convert("RGBA")
+                converted = Image.new("RGB", rgba.size, (255, 255, 255))
+                converted.paste(rgba, mask=rgba.getchannel("A"))
+
+            # 先写临时文件再原子替换，避免并发请求读到半成品
+            tmp_path = variant.with_name(f".{variant.name}.{uuid.uuid4().hex}.tmp")
+            try:
+                converted.save(tmp_path, format=self.image_format, quality=self.quality, optimize=True)
+                os.replace(tmp_path, variant)
+            finally:
+                if tmp_path.exists():
+                    tmp_path.unlink()
+        return variant
+
+
+image_variant_service = ImageVariantService(
+    max_side=settings.IMAGE_PROMPT_VARIANT_MAX_SIDE,
+    image_format=settings.IMAGE_PROMPT_VARIANT_FORMAT,
+    quality=settings.IMAGE_PROMPT_VARIANT_QUALITY,
+)
@@ -0,0 +1,33 @@
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.list_version import ListVersion
+
+SESSIONS_LIST = "sessions"
+MOMENTS_LIST = "moments"
+
+
+def _bump_statement(dialect: str, name: str):
+    """INSERT ... ON CONFLICT (name) DO UPDATE SET version = version + 1"""
+    if dialect == "postgresql":
+        statement = postgresql_insert(ListVersion)
+    elif dialect == "sqlite":
+        statement = sqlite_insert(ListVersion)
+    else:
+        raise RuntimeError(f"不支持的数据库方言: {dialect}")
+    return statement.values(name=name, version=1).on_conflict_do_update(
+        index_elements=[ListVersion.name],
+        set_={"version": ListVersion.version + 1},
+    )
+
+
+async def bump_list_version(db: AsyncSession, name: str) -> None:
+    """列表条目新增或删除时调用，由调用方在同一事务内提交"""
+    await db.execute(_bump_statement(db.get_bind().dialect.name, name))
+
+
+async def get_list_version(db: AsyncSession, name: str) -> int:
+    """主键查询，不需要 COUNT(*)；尚无记录时为 0"""
+    return await db.scalar(select(ListVersion.version).where(ListVersion.name == name)) or 0
@@ -0,0 +1,222 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.file import File as FileModel
+from app.models.message import Message as MessageModel
+from app.models.moment import Moment as MomentModel
+from app.models.session import Session as SessionModel
+from app.services.chat_service import ChatService
+from app.services.feed_cache import invalidate_feed
+from app.services.history_cache import session_history_cache
+from app.services.list_versions import SESSIONS_LIST, bump_list_version
+from app.services.media_resolver import media_resolver
+
+
+logger = logging.getLogger(__name__)
+
+
+class MediaReconciler:
+    """后台修复失效的本地上传引用
+
+    分批扫描 moments / messages / sessions，清理指向已删除本地文件的URL，会话预览图改为
+    第一张仍存在的图片；每批一个短事务提交，读接口因此无需在请求中写库。
+    files 表中文件缺失的记录默认只统计（files_missing），delete_missing_files=True 时才删除。
+    上传目录不存在或扫描不到任何文件时（存储未挂载、重新部署后的空盘）整轮跳过，
+    不把所有引用当作失效永久改写。
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker = AsyncSessionLocal,
+        batch_size: int = 200,
+        delete_missing_files: bool = False,
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.delete_missing_files = delete_missing_files
+        self.last_report: Optional[Dict] = None
+
+    async def reconcile_once(self) -> Dict:
+        """执行一轮完整扫描并返回修复统计"""
+        started_at = datetime.utcnow()
+        # 先重建上传目录索引，才能发现运行期间被删除的文件
+        upload_root = media_resolver.upload_root
+        known_files = await asyncio.to_thread(media_resolver.rescan)
+        skipped = None
+        if not upload_root.is_dir():
+            skipped = "upload_root_missing"
+        elif known_files == 0:
+            skipped = "upload_root_empty"
+        if skipped is not None:
+            logger.warning("Skip media reconcile, local upload root %s is unavailable (%s)", upload_root, skipped)
+            report = {
+                "moments_repaired": 0,
+                "messages_repaired": 0,
+                "sessions_repaired": 0,
+                "files_missing": 0,
+                "files_removed": 0,
+                "skipped": skipped,
+                "started_at": started_at.isoformat() + "Z",
+                "finished_at": datetime.utcnow().isoformat() + "Z",
+            }
+            self.last_report = report
+            return report
+
+        moments_repaired = await self._reconcile_moments()
+        messages_repaired = await self._reconcile_messages()
+        # 消息图片已修复，会话预览可直接从中挑选
+        sessions_repaired = await self._reconcile_sessions()
+        files_missing, files_removed = await self._reconcile_files()
+        report = {
+            "moments_repaired": moments_repaired,
+            "messages_repaired": messages_repaired,
+            "sessions_repaired": sessions_repaired,
+            "files_missing": files_missing,
+            "files_removed": files_removed,
+            "skipped": None,
+            "started_at": started_at.isoformat() + "Z",
+            "finished_at": datetime.utcnow().isoformat() + "Z",
+        }
+        self.last_report = report
+        if moments_repaired:
+            await invalidate_feed()
+        if moments_repaired or messages_repaired or sessions_repaired or files_removed:
+            logger.info("Media reconcile repaired dead local uploads: %s", report)
+        elif files_missing:
+            logger.warning("Media reconcile found %d file records without local files", files_missing)
+        return report
+
+    async def run_periodically(self, interval_seconds: float) -> None:
+        while True:
+            try:
+                await self.reconcile_once()
+            except Exception as exc:
+                logger.error("Media reconcile failed: %s", exc, exc_info=True)
+            await asyncio.sleep(interval_seconds)
+
+    async def _reconcile_moments(self) -> int:
+        repaired = 0
+        last_id = ""
+        while True:
+            async with self.session_factory() as db:
+                result = await db.execute(
+                    select(MomentModel.id, MomentModel.author_avatar_url, MomentModel.image_urls)
+                    .where(MomentModel.id > last_id)
+                    .order_by(MomentModel.id)
+                    .limit(self.batch_size)
+                )
+                rows = result.all()
+                if not rows:
+                    return repaired
+
+                for moment_id, avatar_url, image_urls in rows:
+                    sanitized_avatar = media_resolver.sanitize_media_url(avatar_url)
+                    sanitized_images = media_resolver.sanitize_image_urls(image_urls)
+                    if sanitized_avatar == avatar_url and sanitized_images == (image_urls or []):
+                        continue
+                    await db.execute(
+                        update(MomentModel)
+                        .where(MomentModel.id == moment_id)
+                        .values(author_avatar_url=sanitized_avatar, image_urls=sanitized_images)
+                    )
+                    repaired += 1
+                await db.commit()
+                last_id = rows[-1][0]
+
+    async def _reconcile_messages(self) -> int:
+        repaired = 0
+        last_id = ""
+        while True:
+            async with self.session_factory() as db:
+                result = await db.execute(
+                    select(MessageModel.id, MessageModel.session_id, MessageModel.image_urls)
+                    .where(MessageModel.id > last_id, MessageModel.image_urls.isnot(None))
+                    .order_by(MessageModel.id)
+                    .limit(self.batch_size)
+                )
+                rows = result.all()
+                if not rows:
+                    return repaired
+
+                repaired_sessions = set()
+                for message_id, session_id, image_urls in rows:
+                    sanitized_images = media_resolver.sanitize_image_urls(image_urls) or None
+                    if sanitized_images == (image_urls or None):
+                        continue
+                    await db.execute(
+                        update(MessageModel)
+                        .where(MessageModel.id == message_id)
+                        .values(image_urls=sanitized_images)
+                    )
+                    repaired_sessions.add(session_id)
+                    repaired += 1
+                await db.commit()
+                if session_history_cache is not None:
+                    for session_id in repaired_sessions:
+                        session_history_cache.invalidate(session_id)
+                last_id = rows[-1][0]
+
+    async def _reconcile_sessions(self) -> int:
+        repaired = 0
+        last_id = ""
+        while True:
+            async with self.session_factory() as db:
+                result = await db.execute(
+                    select(SessionModel.id, SessionModel.preview_image_url)
+                    .where(SessionModel.id > last_id, SessionModel.preview_image_url.isnot(None))
+                    .order_by(SessionModel.id)
+                    .limit(self.batch_size)
+                )
+                rows = result.all()
+                if not rows:
+                    return repaired
+
+                dead_ids = [session_id for session_id, url in rows if media_resolver.exists(url) is False]
+                if dead_ids:
+                    previews = await ChatService.first_available_images(db, dead_ids)
+                    for session_id in dead_ids:
+                        # 显式保留 updated_at（否则 onupdate 会刷新），避免预览修复改变会话列表排序
+                        await db.execute(
+                            update(SessionModel)
+                            .where(SessionModel.id == session_id)
+                            .values(preview_image_url=previews[session_id], updated_at=SessionModel.updated_at)
+                        )
+                    # updated_at 未变，通过写入计数器让会话列表 ETag 失效
+                    await bump_list_version(db, SESSIONS_LIST)
+                    await db.commit()
+                    repaired += len(dead_ids)
+                last_id = rows[-1][0]
+
+    async def _reconcile_files(self) -> Tuple[int, int]:
+        missing = 0
+        removed = 0
+        last_id = ""
+        while True:
+            async with self.session_factory() as db:
+                result = await db.execute(
+                    select(FileModel.id, FileModel.url)
+                    .where(FileModel.id > last_id)
+                    .order_by(FileModel.id)
+                    .limit(self.batch_size)
+                )
+                rows = result.all()
+                if not rows:
+                    return missing, removed
+
+                dead_ids = [file_id for file_id, url in rows if media_resolver.exists(url) is False]
+                missing += len(dead_ids)
+                if dead_ids and self.delete_missing_files:
+                    await db.execute(delete(FileModel).where(FileModel.id.in_(dead_ids)))
+                    await db.commit()
+                    removed += len(dead_ids)
+                last_id = rows[-1][0]
+
+
+media_reconciler = MediaReconciler(delete_missing_files=settings.MEDIA_RECONCILE_DELETE_MISSING_FILES)
@@ -0,0 +1,203 @@
+import logging
+import os
+import threading
+import time
+from pathlib import Path, PurePosixPath
+from typing import Dict, List, Optional
+from urllib.parse import urlparse, unquote
+
+from app.core.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+_UPLOADS_PREFIX = "/uploads/"
+
+
+class MediaResolver:
+    """本地上传媒体URL解析与存在性校验
+
+    维护已知上传文件的内存索引（启动时扫描目录填充，上传接口写入时登记），
+    未命中索引的路径回退到一次文件系统检查，并对不存在的结果做短TTL负缓存，
+    使批量清洗图片URL只需字典查找。存在结果同样带TTL，过期后重新检查，
+    运行期间被删除的文件（人工清理、重新部署后的临时磁盘）不会一直被视为存在。
+    """
+
+    def __init__(self, negative_ttl_seconds: float = 30.0, positive_ttl_seconds: float = 300.0):
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.positive_ttl_seconds = positive_ttl_seconds
+        self._root_setting: Optional[str] = None
+        self._root: Optional[Path] = None
+        # 相对路径 → 存在结果过期时间
+        self._known: Dict[str, float] = {}
+        self._missing: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def upload_root(self) -> Path:
+        return self._sync_root()
+
+    def _sync_root(self) -> Path:
+        # 上传目录配置变化（如测试中切换目录）时重置索引
+        if self._root_setting != settings.LOCAL_UPLOAD_DIR:
+            with self._lock:
+                if self._root_setting != settings.LOCAL_UPLOAD_DIR:
+                    self._root = Path(settings.LOCAL_UPLOAD_DIR).resolve()
+                    self._known = {}
+                    self._missing = {}
+                    self._root_setting = settings.LOCAL_UPLOAD_DIR
+        return self._root
+
+    @staticmethod
+    def extract_relative_path(url: Optional[str]) -> Optional[str]:
+        """提取本地上传URL（/uploads/...）对应的相对路径；非本地上传返回 None"""
+        if not url:
+            return None
+
+        stripped = url.strip()
+        if not stripped:
+            return None
+
+        if stripped.startswith(_UPLOADS_PREFIX):
+            return unquote(stripped[len(_UPLOADS_PREFIX):]).lstrip("/")
+
+        try:
+            parsed = urlparse(stripped)
+        except Exception:
+            return None
+
+        if parsed.path.startswith(_UPLOADS_PREFIX):
+            return unquote(parsed.path[len(_UPLOADS_PREFIX):]).lstrip("/")
+        return None
+
+    def is_local_upload(self, url: Optional[str]) -> bool:
+        return self.extract_relative_path(url) is not None
+
+    @staticmethod
+    def _normalize_key(relative_path: str) -> Optional[str]:
+        candidate = PurePosixPath(relative_path.replace("\\", "/"))
+        if not relative_path or candidate.is_absolute() or ".." in candidate.parts:
+            return None
+        return candidate.as_posix()
+
+    def exists(self, url: Optional[str]) -> Optional[bool]:
+        """返回:
+        - True: 本地上传且文件存在
+        - False: 本地上传但文件不存在（或路径非法）
+        - None: 非本地上传URL，无法在本地校验
+        """
+        relative_path = self.extract_relative_path(url)
+        if relative_path is None:
+            return None
+        key = self._normalize_key(relative_path)
+        if key is None:
+            return False
+        return self._exists_key(key)
+
+    def resolve_path(self, url: Optional[str]) -> Optional[Path]:
+        """将存在的本地上传URL映射到磁盘路径"""
+        relative_path = self.extract_relative_path(url)
+        if relative_path is None:
+            return None
+        key = self._normalize_key(relative_path)
+        if key is None or not self._exists_key(key):
+            return None
+        return self.upload_root / key
+
+    def _exists_key(self, key: str) -> bool:
+        root = self.upload_root
+        now = time.monotonic()
+        known_until = self._known.get(key)
+        if known_until is not None and known_until > now:
+            return True
+
+        expires_at = self._missing.get(key)
+        if expires_at is not None and expires_at > now:
+            return False
+
+        target = (root / key).resolve()
+        found = (root in target.parents) and target.is_file()
+        with self._lock:
+            if found:
+                self._known[key] = now + self.positive_ttl_seconds
+                self._missing.pop(key, None)
+            else:
+                self._known.pop(key, None)
+                self._missing[key] = now + self.negative_ttl_seconds
+        return found
+
+    def register(self, relative_path: str) -> None:
+        """登记新写入的上传文件"""
+        self._sync_root()
+        key = self._normalize_key(relative_path)
+        if key is None:
+            return
+        with self._lock:
+            self._known[key] = time.monotonic() + self.positive_ttl_seconds
+            self._missing.pop(key, None)
+
+    def forget(self, relative_path: str) -> None:
+        """移除已删除的上传文件，下次查询重新检查文件系统"""
+        key = self._normalize_key(relative_path)
+        if key is None:
+            return
+        with self._lock:
+            self._known.pop(key, None)
+            self._missing.pop(key, None)
+
+    def rescan(self) -> int:
+        """扫描上传目录重建索引，返回已知文件数量"""
+        root = self.upload_root
+        root_setting = self._root_setting
+        known: Dict[str, float] = {}
+        expires_at = time.monotonic() + self.positive_ttl_seconds
+        for dirpath, _dirnames, filenames in os.walk(root):
+            base = Path(dirpath).relative_to(root)
+            for filename in filenames:
+                known[(base / filename).as_posix()] = expires_at
+
+        with self._lock:
+            if self._root_setting == root_setting:
+                self._known = known
+                self._missing = {}
+        logger.info("Indexed %d local upload files under %s", len(known), root)
+        return len(known)
+
+    def rescan_in_background(self) -> threading.Thread:
+        thread = threading.Thread(target=self._safe_rescan, name="media-resolver-scan", daemon=True)
+        thread.start()
+        return thread
+
+    def _safe_rescan(self) -> None:
+        try:
+            self.rescan()
+        except Exception as exc:
+            logger.warning("Local upload index scan failed: %s", exc)
+
+    def sanitize_media_url(self, url: Optional[str]) -> Optional[str]:
+        """清洗单个媒体URL，本地文件已失效时返回 None"""
+        normalized = (url or "").strip()
+        if not normalized:
+            return None
+        if self.exists(normalized) is False:
+            return None
+        return normalized
+
+    def sanitize_image_urls(self, image_urls: Optional[List[str]]) -> List[str]:
+        """剔除空白及已失效的本地上传图片URL"""
+        sanitized: List[str] = []
+        for raw in image_urls or []:
+            normalized = (raw or "").strip()
+            if not normalized:
+                continue
+            if self.exists(normalized) is False:
+                logger.debug("Skip missing local image URL: %s", normalized)
+                continue
+            sanitized.append(normalized)
+        return sanitized
+
+
+media_resolver = MediaResolver(
+    negative_ttl_seconds=settings.MEDIA_NEGATIVE_CACHE_TTL_SECONDS,
+    positive_ttl_seconds=settings.MEDIA_POSITIVE_CACHE_TTL_SECONDS,
+)
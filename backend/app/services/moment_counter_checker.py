@@ -0,0 +1,125 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.database import AsyncSessionLocal
+from app.models.moment import Moment as MomentModel
+from app.models.moment import MomentComment as MomentCommentModel
+from app.models.moment import MomentLike as MomentLikeModel
+from app.services.feed_cache import invalidate_feed
+
+
+logger = logging.getLogger(__name__)
+
+
+class MomentCounterChecker:
+    """校对 moments.like_count / comment_count 与实际点赞、评论行数
+
+    按 id 分批扫描，每批用两条分组计数查询比对，发现漂移时（repair=True）
+    写回实际值，每批一个短事务。正常情况下计数由写路径原子维护，这里只兜底。
+    """
+
+    def __init__(self, session_factory: async_sessionmaker = AsyncSessionLocal, batch_size: int = 500):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.last_report: Optional[Dict] = None
+
+    async def check_once(self, repair: bool = True) -> Dict:
+        started_at = datetime.utcnow()
+        checked = 0
+        mismatched: List[Dict] = []
+        last_id = ""
+        while True:
+            async with self.session_factory() as db:
+                result = await db.execute(
+                    select(MomentModel.id, MomentModel.like_count, MomentModel.comment_count)
+                    .where(MomentModel.id > last_id)
+                    .order_by(MomentModel.id)
+                    .limit(self.batch_size)
+                )
+                rows = result.all()
+                if not rows:
+                    break
+
+                moment_ids = [row[0] for row in rows]
+                like_counts = await self._count_by_moment(db, MomentLikeModel, moment_ids)
+                comment_counts = await self._count_by_moment(db, MomentCommentModel, moment_ids)
+
+                batch_mismatched = []
+                for moment_id, like_count, comment_count in rows:
+                    actual_likes = like_counts.get(moment_id, 0)
+                    actual_comments = comment_counts.get(moment_id, 0)
+                    if (like_count, comment_count) != (actual_likes, actual_comments):
+                        batch_mismatched.append({
+                            "moment_id": moment_id,
+                            "like_count": like_count,
+                            "actual_like_count": actual_likes,
+                            "comment_count": comment_count,
+                            "actual_comment_count": actual_comments,
+                        })
+
+                if repair and batch_mismatched:
+                    # 用关联子查询在语句内重新计数，避免覆盖比对之后的并发 ±1
+                    await db.execute(
+                        update(MomentModel)
+                        .where(MomentModel.id.in_([item["moment_id"] for item in batch_mismatched]))
+                        .values(
+                            like_count=self._count_subquery(MomentLikeModel),
+                            comment_count=self._count_subquery(MomentCommentModel),
+                        )
+                        .execution_options(synchronize_session=False)
+                    )
+                    await db.commit()
+
+                checked += len(rows)
+                mismatched.extend(batch_mismatched)
+                last_id = rows[-1][0]
+
+        report = {
+            "checked": checked,
+            "mismatched": len(mismatched),
+            "repaired": len(mismatched) if repair else 0,
+            # 仅保留少量样本便于排查
+            "samples": mismatched[:20],
+            "started_at": started_at.isoformat() + "Z",
+            "finished_at": datetime.utcnow().isoformat() + "Z",
+        }
+        self.last_report = report
+        if repair and mismatched:
+            await invalidate_feed()
+        if mismatched:
+            logger.warning("Moment counters drifted: %s", {k: report[k] for k in ("checked", "mismatched", "repaired")})
+        return report
+
+    async def run_periodically(self, interval_seconds: float) -> None:
+        while True:
+            try:
+                await self.check_once()
+            except Exception as exc:
+                logger.error("Moment counter check failed: %s", exc, exc_info=True)
+            await asyncio.sleep(interval_seconds)
+
+    @staticmethod
+    def _count_subquery(model):
+        return (
+            select(func.count())
+            .select_from(model)
+            .where(model.moment_id == MomentModel.id)
+            .scalar_subquery()
+        )
+
+    @staticmethod
+    async def _count_by_moment(db: AsyncSession, model, moment_ids: List[str]) -> Dict[str, int]:
+        result = await db.execute(
+            select(model.moment_id, func.count())
+            .where(model.moment_id.in_(moment_ids))
+            .group_by(model.moment_id)
+        )
+        return {moment_id: count for moment_id, count in result.all()}
+
+
+moment_counter_checker = MomentCounterChecker()
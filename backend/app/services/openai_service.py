@@ -1,13 +1,14 @@
 import asyncio
-from typing import List, Optional, AsyncGenerator
+from typing import Dict, List, Optional, AsyncGenerator
 import logging
 import base64
 import mimetypes
 import re
-from pathlib import Path
-from urllib.parse import urlparse, unquote
 from openai import AsyncAzureOpenAI
 from app.core.config import settings
+from app.services.image_variant_service import image_variant_service
+from app.services.media_resolver import media_resolver
+from app.utils.byte_lru import ByteLRUCache
 from app.utils.token_counter import token_counter
 
 logger = logging.getLogger(__name__)
@@ -25,6 +26,8 @@ class OpenAIService:
             api_version=settings.AZURE_OPENAI_TRANSCRIBE_API_VERSION,
         )
         self.deployment = settings.AZURE_OPENAI_DEPLOYMENT
+        # 本地图片的data URL缓存，键为 (路径, mtime, 大小)，文件变化后自然失效
+        self.data_url_cache = ByteLRUCache(max_bytes=settings.IMAGE_DATA_URL_CACHE_MAX_BYTES)
 
     def _sanitize_moment_copy(self, text: str) -> str:
         cleaned = (text or "").replace("\r\n", "\n").replace("\r", "\n").strip()
@@ -171,44 +174,10 @@ class OpenAIService:
 
         return self._fallback_moment_copy(normalized_user, normalized_assistant, fallback_title)
 
-    def _extract_upload_request_path(self, image_url: str) -> Optional[str]:
-        if not image_url:
-            return None
-
-        parsed = urlparse(image_url)
-        if parsed.scheme in ("http", "https"):
-            request_path = unquote(parsed.path)
-        else:
-            request_path = unquote(image_url)
-
-        if not request_path.startswith("/uploads/"):
-            return None
-        return request_path
-
-    def _resolve_local_upload_path(self, image_url: str) -> Optional[Path]:
-        """将本地上传URL映射到磁盘路径。"""
-        request_path = self._extract_upload_request_path(image_url)
-        if not request_path:
-            return None
-
-        relative_path = request_path[len("/uploads/"):]
-        upload_root = Path(settings.LOCAL_UPLOAD_DIR).resolve()
-        candidate = (upload_root / relative_path).resolve()
-
-        try:
-            candidate.relative_to(upload_root)
-        except ValueError:
-            return None
-
-        if not candidate.exists():
-            return None
-
-        return candidate
-
     def _prepare_image_url(self, image_url: str) -> Optional[str]:
         """如果是本地上传图片，转换为data URL；若文件已失效则跳过。"""
-        is_local_upload = self._extract_upload_request_path(image_url) is not None
-        local_path = self._resolve_local_upload_path(image_url)
+        is_local_upload = media_resolver.is_local_upload(image_url)
+        local_path = media_resolver.resolve_path(image_url)
         if not local_path:
             if is_local_upload:
                 logger.warning("Skip inaccessible local upload for OpenAI: %s", image_url)
@@ -216,22 +185,42 @@ class OpenAIService:
             return image_url
 
         try:
+            # 以原图的 (路径, mtime, 大小) 为键：变体由原图决定，命中时无需再检查或生成变体
+            use_variant = settings.IMAGE_PROMPT_VARIANT_ENABLED
+            stat = local_path.stat()
+            cache_key = (str(local_path), stat.st_mtime_ns, stat.st_size, use_variant)
+            cached = self.data_url_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+            if use_variant:
+                local_path = image_variant_service.get_prompt_image(local_path)
             mime_type, _ = mimetypes.guess_type(str(local_path))
             mime_type = mime_type or "application/octet-stream"
             encoded = base64.b64encode(local_path.read_bytes()).decode("ascii")
-            return f"data:{mime_type};base64,{encoded}"
+            data_url = f"data:{mime_type};base64,{encoded}"
+            self.data_url_cache.put(cache_key, data_url, len(data_url))
+            return data_url
         except Exception as exc:
             logger.warning("Failed to convert local image to data URL: %s", exc)
             if is_local_upload:
                 return None
             return image_url
 
+    def _prepare_image_urls(self, image_urls: List[str]) -> Dict[str, Optional[str]]:
+        """批量准备图片URL，同一URL只处理一次"""
+        return {image_url: self._prepare_image_url(image_url) for image_url in dict.fromkeys(image_urls)}
+
     async def chat_completion_stream(
         self,
         messages: List[dict],
-        max_completion_tokens: Optional[int] = None
+        max_completion_tokens: Optional[int] = None,
+        input_tokens: Optional[int] = None
     ) -> AsyncGenerator[str, None]:
-        """流式聊天补全，支持图片和音频文本输入，自动计算token限制"""
+        """流式聊天补全，支持图片和音频文本输入，自动计算token限制
+
+        input_tokens 为调用方截断历史时已得到的token总数，提供时不再重复计数。
+        """
 
         if settings.MOCK_OPENAI:
             user_texts = [
@@ -313,7 +302,8 @@ class OpenAIService:
             return
 
         # 计算输入消息的token数量
-        input_tokens = token_counter.count_conversation_tokens(messages)
+        if input_tokens is None:
+            input_tokens = token_counter.count_conversation_tokens(messages)
 
         # GPT-4o最大上下文长度：131072 tokens
         max_context_tokens = 131072
@@ -346,6 +336,12 @@ class OpenAIService:
 
         logger.info(f"Token统计: 输入={input_tokens}, 可用={available_tokens}, 补全={completion_tokens}")
 
+        # 本地图片读取与编码放到线程中批量完成，避免阻塞事件循环
+        prepared_image_urls = await asyncio.to_thread(
+            self._prepare_image_urls,
+            [img_url for msg in messages for img_url in msg.get("image_urls") or []]
+        )
+
         # 构建消息列表
         openai_messages = []
         for msg in messages:
@@ -367,7 +363,7 @@ class OpenAIService:
             # 添加图片内容
             if msg.get("image_urls"):
                 for img_url in msg["image_urls"]:
-                    prepared_url = self._prepare_image_url(img_url)
+                    prepared_url = prepared_image_urls.get(img_url)
                     if not prepared_url:
                         continue
                     content.append({
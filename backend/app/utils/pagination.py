@@ -0,0 +1,48 @@
+import base64
+import json
+from datetime import datetime
+from typing import Tuple
+
+from sqlalchemy import tuple_
+
+
+def encode_cursor(timestamp: datetime, item_id: str) -> str:
+    """将 (时间戳, id) 编码为不透明游标"""
+    payload = json.dumps([timestamp.isoformat(), item_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """解析游标；格式非法时抛出 ValueError"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, item_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(timestamp), str(item_id)
+    except (TypeError, ValueError, UnicodeError) as exc:
+        raise ValueError("无效的分页游标") from exc
+
+
+# 使用行值比较而非 ts < x OR (ts = x AND id < y)：Postgres 只能把行值比较
+# 当作 (ts, id) 复合索引上的单个范围条件，SQLite 3.15+ 同样支持
+
+
+def older_than(timestamp_column, id_column, timestamp: datetime, item_id: str):
+    """(ts, id) < (timestamp, item_id)"""
+    return tuple_(timestamp_column, id_column) < tuple_(timestamp, item_id)
+
+
+def newer_than(timestamp_column, id_column, timestamp: datetime, item_id: str):
+    """(ts, id) > (timestamp, item_id)"""
+    return tuple_(timestamp_column, id_column) > tuple_(timestamp, item_id)
+
+
+def keyset_before(timestamp_column, id_column, cursor: str):
+    """倒序列表中位于游标之后（更旧）的行"""
+    timestamp, item_id = decode_cursor(cursor)
+    return older_than(timestamp_column, id_column, timestamp, item_id)
+
+
+def keyset_after(timestamp_column, id_column, cursor: str):
+    """正序列表中位于游标之后（更新）的行"""
+    timestamp, item_id = decode_cursor(cursor)
+    return newer_than(timestamp_column, id_column, timestamp, item_id)
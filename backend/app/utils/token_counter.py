@@ -1,21 +1,183 @@
+import asyncio
+import hashlib
+import logging
+import os
+import sys
+import threading
 import tiktoken
-from typing import List, Dict
+from tiktoken.load import load_tiktoken_bpe
+from bisect import bisect_left
+from itertools import accumulate
+from typing import Any, Callable, List, Dict, Optional, Tuple
+from app.core.config import settings
+from app.utils.byte_lru import ByteLRUCache
+
+# 每条缓存项除 key 与计数对象外的固定开销：OrderedDict 节点 + (值, 大小) 元组
+_CACHE_ENTRY_OVERHEAD_BYTES = 64 + sys.getsizeof((0, 0))
+
+# encode_batch 依赖线程池，文本较少或单核时逐条编码更快
+_BATCH_ENCODE_MIN_TEXTS = 8
+
+# 与 tiktoken_ext.openai_public.cl100k_base 一致，用于从本地BPE文件构建编码
+_CL100K_PAT_STR = r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}++|\p{N}{1,3}+| ?[^\s\p{L}\p{N}]++[\r\n]*+|\s++$|\s*[\r\n]|\s+(?!\S)|\s"""
+_CL100K_SPECIAL_TOKENS = {
+    "<|endoftext|>": 100257,
+    "<|fim_prefix|>": 100258,
+    "<|fim_middle|>": 100259,
+    "<|fim_suffix|>": 100260,
+    "<|endofprompt|>": 100276,
+}
+
+logger = logging.getLogger(__name__)
+
+
+class TokenCountCache:
+    """按文本内容哈希缓存token数量的LRU，同时限制条目数与总字节数（基于 ByteLRUCache）"""
+
+    def __init__(self, max_entries: int = 4096, max_bytes: int = 4 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = ByteLRUCache(max_bytes=max_bytes, max_entries=max_entries)
+
+    @staticmethod
+    def make_key(text: str) -> bytes:
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    @staticmethod
+    def entry_size(key: bytes, count: int) -> int:
+        """条目的近似内存占用：key 与计数对象本身加上 OrderedDict 节点及 (值, 大小) 元组开销"""
+        return sys.getsizeof(key) + sys.getsizeof(count) + _CACHE_ENTRY_OVERHEAD_BYTES
+
+    def get(self, key: bytes) -> Optional[int]:
+        return self._entries.get(key)
+
+    def put(self, key: bytes, count: int) -> None:
+        self._entries.put(key, count, self.entry_size(key, count))
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._entries.hits = 0
+        self._entries.misses = 0
+
+    def stats(self) -> Dict:
+        return self._entries.stats()
+
 
 class TokenCounter:
-    def __init__(self, model: str = "gpt-4"):
-        """初始化token计数器"""
+    def __init__(
+        self,
+        model: str = "gpt-4",
+        cache: Optional[TokenCountCache] = None,
+        encoding_file: Optional[str] = None
+    ):
+        """初始化token计数器
+
+        编码在首次使用时才加载（冷缓存时 tiktoken 可能需要联网下载BPE文件）。
+        cache 为可选的token数量缓存；encoding_file 指向本地 cl100k_base BPE 文件，
+        离线环境可借此避免网络下载。
+        """
+        self.model = model
+        self.cache = cache
+        self.encoding_file = encoding_file
+        self._encoding: Optional[tiktoken.Encoding] = None
+        self._encoding_lock = threading.Lock()
+
+    @property
+    def encoding(self) -> tiktoken.Encoding:
+        if self._encoding is None:
+            with self._encoding_lock:
+                if self._encoding is None:
+                    self._encoding = self._load_encoding()
+        return self._encoding
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._encoding is not None
+
+    def _load_encoding(self) -> tiktoken.Encoding:
+        if self.encoding_file:
+            return tiktoken.Encoding(
+                name="cl100k_base",
+                pat_str=_CL100K_PAT_STR,
+                mergeable_ranks=load_tiktoken_bpe(self.encoding_file),
+                special_tokens=_CL100K_SPECIAL_TOKENS,
+            )
         try:
-            self.encoding = tiktoken.encoding_for_model(model)
+            return tiktoken.encoding_for_model(self.model)
         except KeyError:
             # 如果模型不存在，使用cl100k_base编码（GPT-4/GPT-3.5使用）
-            self.encoding = tiktoken.get_encoding("cl100k_base")
+            return tiktoken.get_encoding("cl100k_base")
+
+    def warm_up(self) -> None:
+        """预加载编码；失败时仅记录日志，首次使用时会再次尝试"""
+        try:
+            self.encoding
+        except Exception as exc:
+            logger.warning("Token encoding warm-up failed: %s", exc)
+
+    def warm_up_in_background(self) -> threading.Thread:
+        """在后台线程中预加载编码，不阻塞服务启动"""
+        thread = threading.Thread(target=self.warm_up, name="token-counter-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    async def run_async(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """在事件循环中执行计数函数
+
+        编码尚未加载时（后台预热可能正持有加载锁并在下载BPE），放到线程池执行，
+        避免事件循环阻塞在锁上；加载完成后编码很快，直接调用。
+        """
+        if self.is_loaded:
+            return func(*args, **kwargs)
+        return await asyncio.to_thread(func, *args, **kwargs)
 
     def count_tokens(self, text: str) -> int:
         """计算文本的token数量"""
-        return len(self.encoding.encode(text))
+        if self.cache is None:
+            return len(self.encoding.encode(text))
+
+        key = self.cache.make_key(text)
+        count = self.cache.get(key)
+        if count is None:
+            count = len(self.encoding.encode(text))
+            self.cache.put(key, count)
+        return count
+
+    def count_tokens_batch(self, texts: List[str]) -> List[int]:
+        """批量计算token数量，未命中缓存的文本通过 encode_batch 一次编码"""
+        if not texts:
+            return []
+        if self.cache is None:
+            return self._encode_lengths(texts)
+
+        keys = [self.cache.make_key(text) for text in texts]
+        counts: List[Optional[int]] = [self.cache.get(key) for key in keys]
+        missing = [idx for idx, count in enumerate(counts) if count is None]
+        if missing:
+            lengths = self._encode_lengths([texts[idx] for idx in missing])
+            for idx, length in zip(missing, lengths):
+                counts[idx] = length
+                self.cache.put(keys[idx], length)
+        return counts
+
+    def _encode_lengths(self, texts: List[str]) -> List[int]:
+        if len(texts) >= _BATCH_ENCODE_MIN_TEXTS and (os.cpu_count() or 1) > 1:
+            return [len(tokens) for tokens in self.encoding.encode_batch(texts)]
+        return [len(self.encoding.encode(text)) for text in texts]
+
+    def cache_stats(self) -> Optional[Dict]:
+        """返回缓存命中统计，未启用缓存时为 None"""
+        return self.cache.stats() if self.cache is not None else None
 
     def count_message_tokens(self, message: Dict) -> int:
-        """计算单条消息的token数量（包括图像和音频文本）"""
+        """计算单条消息的token数量（包括图像和音频文本）
+
+        若消息带有已持久化的 token_count，直接复用，避免重复编码。
+        """
+        stored = message.get("token_count")
+        if stored is not None:
+            return stored
+
         tokens = 0
 
         # 文本内容
@@ -36,30 +198,72 @@ class TokenCounter:
 
         return tokens
 
+    def count_messages_tokens(self, messages: List[Dict]) -> List[int]:
+        """批量计算每条消息的token数量，需要编码的文本合并为一次批量调用"""
+        counts: List[int] = []
+        texts: List[str] = []
+        owners: List[int] = []
+        for idx, message in enumerate(messages):
+            stored = message.get("token_count")
+            if stored is not None:
+                counts.append(stored)
+                continue
+
+            counts.append(len(message["image_urls"]) * 85 if message.get("image_urls") else 0)
+            for field in ("content", "audio_text", "role"):
+                if message.get(field):
+                    texts.append(message[field])
+                    owners.append(idx)
+
+        for idx, count in zip(owners, self.count_tokens_batch(texts)):
+            counts[idx] += count
+        return counts
+
     def count_conversation_tokens(self, messages: List[Dict]) -> int:
         """计算整个对话的token数量"""
-        total = 0
-        for msg in messages:
-            total += self.count_message_tokens(msg)
-        return total
+        return sum(self.count_messages_tokens(messages))
 
-    def truncate_messages(
+    def truncate_messages_with_total(
         self,
         messages: List[Dict],
         max_tokens: int = 120000,
         max_messages: int = 50
-    ) -> List[Dict]:
-        """截断消息列表以符合token限制"""
-        if len(messages) > max_messages:
-            messages = messages[-max_messages:]
+    ) -> Tuple[List[Dict], int]:
+        """截断消息列表以符合token限制，返回保留的消息切片及其token总数
 
-        total_tokens = self.count_conversation_tokens(messages)
+        每条消息只计数一次，借助前缀和与二分查找一次定位截断点，
+        不修改调用方传入的列表。
+        """
+        window = messages[-max_messages:] if len(messages) > max_messages else messages
+        if not window:
+            return [], 0
 
-        # 如果token数超出限制，从最旧的消息开始移除
-        while total_tokens > max_tokens and len(messages) > 1:
-            removed = messages.pop(0)
-            total_tokens -= self.count_message_tokens(removed)
+        # prefix[i] 为前 i 条消息的token总和，保留 window[i:] 的总量为 total - prefix[i]
+        prefix = list(accumulate(self.count_messages_tokens(window), initial=0))
+        total = prefix[-1]
 
-        return messages
+        # 找到最早的截断点使剩余总量不超过限制，且至少保留最后一条消息
+        cut = min(bisect_left(prefix, total - max_tokens), len(window) - 1)
+        return window[cut:], total - prefix[cut]
+
+    def truncate_messages(
+        self,
+        messages: List[Dict],
+        max_tokens: int = 120000,
+        max_messages: int = 50
+    ) -> List[Dict]:
+        """截断消息列表以符合token限制"""
+        truncated, _ = self.truncate_messages_with_total(
+            messages,
+            max_tokens=max_tokens,
+            max_messages=max_messages
+        )
+        return truncated
 
-token_counter = TokenCounter()
\ No newline at end of file
+token_counter = TokenCounter(
+    encoding_file=settings.TIKTOKEN_ENCODING_FILE,
+    cache=TokenCountCache(
+        max_entries=settings.TOKEN_COUNT_CACHE_MAX_ENTRIES,
+        max_bytes=settings.TOKEN_COUNT_CACHE_MAX_BYTES,
+    ) if settings.TOKEN_COUNT_CACHE_ENABLED else None
+)
\ No newline at end of file
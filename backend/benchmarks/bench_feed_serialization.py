@@ -0,0 +1,136 @@
+"""
+朋友圈列表序列化基准：50 条动态、共 200 条评论预览的一页
+
+旧流程：逐条构造 MomentResponse/MomentCommentResponse，返回 MomentsListResponse 后
+FastAPI 再按 response_model 校验一遍，最后由标准库 json 编码。
+新流程：从 ORM 行直接构造 dict，orjson 一次编码。
+
+运行: ENV_FILE=.env.test PYTHONPATH=. python benchmarks/bench_feed_serialization.py
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import orjson
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app.api.endpoints.moments import _serialize_moment, _to_utc_iso
+from app.models.moment import Moment, MomentComment
+from app.services.media_resolver import media_resolver
+from app.schemas.moment import MomentCommentResponse, MomentResponse, MomentsListResponse
+
+MOMENTS = 50
+COMMENTS = 200
+LIKES_PER_MOMENT = 20
+ROUNDS = 300
+
+
+def _build_page():
+    base = datetime(2026, 1, 1, 12, 0, 0)
+    moments, previews = [], {}
+    comments_per_moment = COMMENTS // MOMENTS
+    for index in range(MOMENTS):
+        moment = Moment(
+            id=f"moment-{index:04d}",
+            author_name="你",
+            author_avatar_url="/uploads/avatar.png",
+            content=f"第 {index} 条动态，今天天气不错" * 3,
+            image_urls=[f"/uploads/{index}-{n}.jpg" for n in range(3)],
+            location="上海",
+            created_at=base - timedelta(minutes=index),
+            like_count=LIKES_PER_MOMENT,
+            comment_count=comments_per_moment,
+        )
+        comments = [
+            MomentComment(
+                id=f"comment-{index:04d}-{n}",
+                moment_id=moment.id,
+                user_name=f"好友{n}",
+                content=f"评论内容 {n}",
+                created_at=moment.created_at + timedelta(seconds=n),
+            )
+            for n in range(comments_per_moment)
+        ]
+        moments.append(moment)
+        previews[moment.id] = {
+            "likes": [f"好友{n}" for n in range(LIKES_PER_MOMENT)],
+            "liked_by_me": index % 2 == 0,
+            "comments": comments,
+        }
+    return moments, previews
+
+
+def _legacy_moment(moment: Moment, preview: dict) -> MomentResponse:
+    return MomentResponse(
+        id=moment.id,
+        author_name=moment.author_name,
+        author_avatar_url=media_resolver.sanitize_media_url(moment.author_avatar_url),
+        content=moment.content,
+        image_urls=media_resolver.sanitize_image_urls(moment.image_urls),
+        location=moment.location,
+        session_id=moment.session_id,
+        created_at=_to_utc_iso(moment.created_at),
+        like_count=moment.like_count,
+        comment_count=moment.comment_count,
+        likes=preview["likes"],
+        liked_by_me=preview["liked_by_me"],
+        comments=[
+            MomentCommentResponse(
+                id=comment.id,
+                moment_id=comment.moment_id,
+                parent_id=comment.parent_id,
+                user_name=comment.user_name,
+                reply_to_name=comment.reply_to_name,
+                content=comment.content,
+                created_at=_to_utc_iso(comment.created_at),
+            )
+            for comment in preview["comments"]
+        ],
+    )
+
+
+async def _legacy_render(field, moments, previews) -> bytes:
+    payload = MomentsListResponse(
+        moments=[_legacy_moment(moment, previews[moment.id]) for moment in moments],
+        total=MOMENTS, page=1, limit=MOMENTS, has_more=True, next_cursor="cursor",
+    )
+    content = await serialize_response(field=field, response_content=payload)
+    return JSONResponse(content).body
+
+
+async def _fast_render(_field, moments, previews) -> bytes:
+    return orjson.dumps({
+        "moments": [_serialize_moment(moment, previews[moment.id]) for moment in moments],
+        "total": MOMENTS, "page": 1, "limit": MOMENTS, "has_more": True, "next_cursor": "cursor",
+    })
+
+
+async def _measure(render, field, moments, previews) -> float:
+    await render(field, moments, previews)
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        await render(field, moments, previews)
+    return (time.perf_counter() - start) / ROUNDS * 1000
+
+
+async def main() -> None:
+    moments, previews = _build_page()
+    field = create_response_field(name="moments_page", type_=MomentsListResponse)
+
+    legacy_body = await _legacy_render(field, moments, previews)
+    fast_body = await _fast_render(field, moments, previews)
+    # 两条路径输出的 JSON 内容必须一致
+    assert orjson.loads(legacy_body) == orjson.loads(fast_body)
+
+    legacy = await _measure(_legacy_render, field, moments, previews)
+    fast = await _measure(_fast_render, field, moments, previews)
+
+    print(f"moments: {MOMENTS}, comments: {COMMENTS}, likes/moment: {LIKES_PER_MOMENT}, body: {len(fast_body)} bytes")
+    print(f"pydantic + json  {legacy:7.3f} ms/page")
+    print(f"dict + orjson    {fast:7.3f} ms/page  ({legacy / fast:.1f}x)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
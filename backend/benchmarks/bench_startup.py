@@ -0,0 +1,54 @@
+"""
+冷启动基准：在全新解释器中测量导入应用与首次token计数的耗时
+
+运行: ENV_FILE=.env.test PYTHONPATH=. python benchmarks/bench_startup.py
+"""
+import json
+import os
+import subprocess
+import sys
+
+RUNS = 5
+
+# 子进程脚本：分别记录导入 app.main 与首次计数（触发编码加载）的耗时
+_PROBE = """
+import json, time
+start = time.perf_counter()
+import app.main
+from app.utils.token_counter import token_counter
+imported = time.perf_counter()
+loaded_at_import = token_counter.is_loaded
+token_counter.count_tokens("warm up")
+counted = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "first_count_ms": (counted - imported) * 1000,
+    "loaded_at_import": loaded_at_import,
+}))
+"""
+
+
+def _run_probe() -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", _PROBE],
+        check=True,
+        capture_output=True,
+        text=True,
+        env=os.environ.copy(),
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main() -> None:
+    samples = [_run_probe() for _ in range(RUNS)]
+    import_ms = sorted(sample["import_ms"] for sample in samples)
+    first_count_ms = sorted(sample["first_count_ms"] for sample in samples)
+
+    print(f"runs: {RUNS}")
+    print(f"encoding loaded at import: {samples[0]['loaded_at_import']}")
+    print(f"import app.main       median {import_ms[RUNS // 2]:8.1f} ms  (min {import_ms[0]:.1f})")
+    print(f"first count_tokens    median {first_count_ms[RUNS // 2]:8.1f} ms  (min {first_count_ms[0]:.1f})")
+
+
+if __name__ == "__main__":
+    main()
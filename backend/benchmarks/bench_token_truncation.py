@@ -0,0 +1,62 @@
+"""
+历史截断微基准：对比逐条 pop(0) 截断与前缀和+二分截断（1k 条消息历史）
+
+运行: ENV_FILE=.env.test PYTHONPATH=. python benchmarks/bench_token_truncation.py
+"""
+import random
+import timeit
+from typing import Dict, List
+
+from app.utils.token_counter import token_counter
+
+HISTORY_SIZE = 1000
+REPEAT = 5
+NUMBER = 20
+
+
+def _build_history(with_stored_counts: bool) -> List[Dict]:
+    rng = random.Random(42)
+    history = []
+    for i in range(HISTORY_SIZE):
+        content = " ".join(f"word{rng.randint(0, 5000)}" for _ in range(rng.randint(20, 200)))
+        message = {"role": "user" if i % 2 == 0 else "assistant", "content": content}
+        if with_stored_counts:
+            message["token_count"] = token_counter.count_message_tokens(message)
+        history.append(message)
+    return history
+
+
+def _legacy_truncate(messages: List[Dict], max_tokens: int, max_messages: int) -> List[Dict]:
+    """优化前的实现：整体计数后逐条 pop(0)"""
+    if len(messages) > max_messages:
+        messages = messages[-max_messages:]
+    total_tokens = token_counter.count_conversation_tokens(messages)
+    while total_tokens > max_tokens and len(messages) > 1:
+        removed = messages.pop(0)
+        total_tokens -= token_counter.count_message_tokens(removed)
+    return messages
+
+
+def _bench(label: str, func) -> None:
+    best = min(timeit.repeat(func, repeat=REPEAT, number=NUMBER)) / NUMBER
+    print(f"{label:<48} {best * 1000:9.3f} ms/call")
+
+
+def main() -> None:
+    for with_stored_counts in (False, True):
+        history = _build_history(with_stored_counts)
+        total = token_counter.count_conversation_tokens(history)
+        # 预算取总量的一半，迫使截断丢弃约一半历史
+        max_tokens = total // 2
+        suffix = "stored token_count" if with_stored_counts else "re-encode"
+        print(f"\n{HISTORY_SIZE} messages, {total} tokens, budget {max_tokens} ({suffix})")
+
+        _bench("legacy pop(0) truncate", lambda: _legacy_truncate(list(history), max_tokens, HISTORY_SIZE))
+        _bench(
+            "prefix-sum truncate_messages_with_total",
+            lambda: token_counter.truncate_messages_with_total(history, max_tokens, HISTORY_SIZE),
+        )
+
+
+if __name__ == "__main__":
+    main()
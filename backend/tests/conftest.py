@@ -0,0 +1,17 @@
+"""
+测试公共配置：SQLite 默认不校验外键，测试中开启，使行为与 Postgres 一致
+"""
+from sqlalchemy import event
+
+from app.core.database import async_engine, engine
+
+
+def _enable_sqlite_foreign_keys(dbapi_connection, _record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+for _engine in (engine, async_engine.sync_engine):
+    if _engine.dialect.name == "sqlite":
+        event.listen(_engine, "connect", _enable_sqlite_foreign_keys)
@@ -1,15 +1,38 @@
+import asyncio
+import base64
+import json
+import threading
+from datetime import datetime
+from contextlib import asynccontextmanager
+
 import pytest
+from PIL import Image
 from fastapi.testclient import TestClient
 from app.main import app
-from app.core.database import Base, engine, SessionLocal
+from sqlalchemy import event
+from app.core.database import Base, engine, SessionLocal, AsyncSessionLocal, async_engine, to_async_database_url, async_connect_args
 from app.core.config import settings
 from app.models.session import Session as SessionModel
 from app.models.message import Message as MessageModel
 from app.models.moment import Moment as MomentModel
+from app.models.moment import MomentComment as MomentCommentModel
+from app.models.moment import MomentLike as MomentLikeModel
+from app.models.file import File as FileModel
+from app.schemas.chat import SessionsResponse
+from app.schemas.moment import MomentCommentsPageResponse, MomentLikesPageResponse, MomentsListResponse
+from app.api.endpoints import moments as moments_endpoint
 from app.api.endpoints import upload as upload_endpoint
 from app.services import chat_service
+from app.services.count_cache import CountCache, list_count_cache
+from app.services.feed_cache import FeedCache, InProcessFeedBackend, feed_cache
 from app.services.file_service import FileService
+from app.services.history_cache import SessionHistoryCache
+from app.services.image_variant_service import image_variant_service
+from app.services.media_reconciler import MediaReconciler
+from app.services.media_resolver import MediaResolver
+from app.services.moment_counter_checker import MomentCounterChecker
 from app.services.openai_service import openai_service
+from app.utils.token_counter import TokenCountCache, TokenCounter, token_counter
 
 # 创建测试客户端，包含API密钥头
 client = TestClient(app, headers={
@@ -21,6 +44,10 @@ def test_db():
     """为每个测试创建独立的测试数据库"""
     # 创建表
     Base.metadata.create_all(bind=engine)
+    # 测试直接写库不经过失效路径，避免沿用上个用例缓存的总数与列表页
+    list_count_cache.invalidate()
+    if feed_cache is not None:
+        asyncio.run(feed_cache.invalidate_all())
     db = SessionLocal()
     yield db
     # 清理
@@ -87,6 +114,70 @@ def test_session_messages_endpoint(test_db):
     assert data["messages"][0]["content"] == "Test message"
 
 
+def test_session_messages_cursor_pagination_and_stream(test_db):
+    """消息历史支持 before/after 游标、倒序加载与 NDJSON 流式输出"""
+    session = SessionModel(id="long-session")
+    test_db.add(session)
+    test_db.add_all([
+        MessageModel(
+            id=f"msg-{index}",
+            session_id=session.id,
+            role="user" if index % 2 == 0 else "assistant",
+            content=f"第{index}条",
+            created_at=datetime(2026, 1, 1, 0, 0, index),
+        )
+        for index in range(7)
+    ])
+    test_db.commit()
+
+    url = f"/api/sessions/{session.id}/messages"
+    newest = client.get(url, params={"order": "desc", "limit": 3}).json()
+    assert [msg["id"] for msg in newest["messages"]] == ["msg-6", "msg-5", "msg-4"]
+    assert newest["has_more"] is True
+    assert newest["next_cursor"] == "msg-4"
+
+    older = client.get(url, params={"order": "desc", "limit": 3, "before": "msg-4"}).json()
+    assert [msg["id"] for msg in older["messages"]] == ["msg-3", "msg-2", "msg-1"]
+
+    oldest = client.get(url, params={"order": "desc", "limit": 3, "before": "msg-1"}).json()
+    assert [msg["id"] for msg in oldest["messages"]] == ["msg-0"]
+    assert oldest["has_more"] is False and oldest["next_cursor"] is None
+
+    newer = client.get(url, params={"after": "msg-4"}).json()
+    assert [msg["id"] for msg in newer["messages"]] == ["msg-5", "msg-6"]
+
+    assert client.get(url, params={"before": "missing"}).status_code == 400
+
+    # 流式输出期间只占用流本身的一个连接，请求会话的连接已在返回前释放
+    checked_out = {"current": 0, "max": 0}
+
+    def on_checkout(*_args):
+        checked_out["current"] += 1
+        checked_out["max"] = max(checked_out["max"], checked_out["current"])
+
+    def on_checkin(*_args):
+        checked_out["current"] -= 1
+
+    event.listen(async_engine.sync_engine.pool, "checkout", on_checkout)
+    event.listen(async_engine.sync_engine.pool, "checkin", on_checkin)
+    try:
+        response = client.get(url, params={"stream": "true", "after": "msg-1"})
+    finally:
+        event.remove(async_engine.sync_engine.pool, "checkout", on_checkout)
+        event.remove(async_engine.sync_engine.pool, "checkin", on_checkin)
+    assert checked_out["max"] == 1
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[0]["session"]["id"] == session.id
+    assert [line["message"]["id"] for line in lines[1:-1]] == ["msg-2", "msg-3", "msg-4", "msg-5", "msg-6"]
+    assert lines[-1] == {"meta": {"has_more": False, "next_cursor": None}}
+
+    # 流式分页：末行给出 has_more 与下一页游标
+    paged = client.get(url, params={"stream": "true", "order": "desc", "limit": 3})
+    lines = [json.loads(line) for line in paged.text.splitlines()]
+    assert [line["message"]["id"] for line in lines[1:-1]] == ["msg-6", "msg-5", "msg-4"]
+    assert lines[-1] == {"meta": {"has_more": True, "next_cursor": "msg-4"}}
+
 def test_create_moment_from_history_session(test_db, monkeypatch):
     """测试从历史对话一键生成朋友圈"""
     session = SessionModel(title="晚安前聊聊")
@@ -172,7 +263,7 @@ def test_upload_endpoint_falls_back_to_local_storage(test_db, monkeypatch, tmp_p
 
 def test_chat_stream_endpoint(test_db, monkeypatch):
     """测试聊天流式端点"""
-    async def mock_stream(_messages):
+    async def mock_stream(_messages, **_kwargs):
         yield "Mock stream response"
 
     monkeypatch.setattr(chat_service.openai_service, "chat_completion_stream", mock_stream)
@@ -195,6 +286,326 @@ def test_chat_stream_endpoint(test_db, monkeypatch):
     assert "data: session:" in content
     assert "data: Mock stream response" in content
 
+def test_chat_stream_releases_db_session_while_streaming(test_db, monkeypatch):
+    """流式输出期间不应持有数据库会话"""
+    open_sessions = []
+
+    @asynccontextmanager
+    async def tracking_factory():
+        async with AsyncSessionLocal() as db:
+            open_sessions.append(db)
+            try:
+                yield db
+            finally:
+                open_sessions.remove(db)
+
+    async def mock_stream(_messages, **_kwargs):
+        assert open_sessions == []
+        yield "streamed"
+
+    monkeypatch.setattr(chat_service.openai_service, "chat_completion_stream", mock_stream)
+
+    async def run_chat():
+        service = chat_service.ChatService(session_factory=tracking_factory)
+        return [chunk async for chunk in service.process_chat(None, "Hello")]
+
+    chunks = asyncio.run(run_chat())
+    assert chunks[0].startswith("session:")
+    assert chunks[1] == "streamed"
+
+    session_id = chunks[0][len("session:"):]
+    roles = [
+        row.role
+        for row in test_db.query(MessageModel)
+        .filter(MessageModel.session_id == session_id)
+        .order_by(MessageModel.created_at)
+    ]
+    assert roles == ["user", "assistant"]
+
+def test_chat_persists_message_token_counts(test_db, monkeypatch):
+    """消息写入时持久化token数量，历史截断直接复用"""
+    async def mock_stream(_messages, **_kwargs):
+        yield "Mock stream response"
+
+    monkeypatch.setattr(chat_service.openai_service, "chat_completion_stream", mock_stream)
+    client.post("/api/chat", json={"message": "Hello token", "session_id": None})
+
+    messages = test_db.query(MessageModel).order_by(MessageModel.created_at).all()
+    assert [msg.token_count for msg in messages] == [
+        token_counter.count_message_tokens({"role": "user", "content": "Hello token"}),
+        token_counter.count_message_tokens({"role": "assistant", "content": "Mock stream response"}),
+    ]
+
+    # 已持久化的计数优先于重新编码
+    assert token_counter.count_message_tokens({"role": "user", "content": "很长的内容" * 100, "token_count": 7}) == 7
+
+def test_session_history_writes_back_missing_token_counts(test_db):
+    """迁移前的旧消息 token_count 为 NULL，首次计入历史时回写"""
+    session = SessionModel(title="旧会话")
+    test_db.add(session)
+    test_db.commit()
+    test_db.add(MessageModel(session_id=session.id, role="user", content="legacy message"))
+    test_db.commit()
+
+    async def load_history():
+        service = chat_service.ChatService(history_cache=None)
+        async with AsyncSessionLocal() as db:
+            return await service._get_session_history(db, session.id)
+
+    history, total = asyncio.run(load_history())
+    expected = token_counter.count_message_tokens({"role": "user", "content": "legacy message"})
+    assert history[0]["token_count"] == expected
+    assert total == expected
+
+    test_db.expire_all()
+    assert test_db.query(MessageModel).one().token_count == expected
+
+def test_sessions_list_reads_denormalized_summary(test_db, monkeypatch):
+    """会话列表直接读取冗余计数/预览字段，不再加载 messages"""
+    async def mock_stream(_messages, **_kwargs):
+        yield "reply"
+
+    monkeypatch.setattr(chat_service.openai_service, "chat_completion_stream", mock_stream)
+    response = client.post(
+        "/api/chat",
+        json={"message": "看图", "session_id": None, "image_urls": ["https://example.com/a.png"]}
+    )
+    session_id = response.text.split("session:", 1)[1].split("\n", 1)[0].strip()
+    client.post("/api/chat", json={"message": "继续", "session_id": session_id})
+
+    stored = test_db.get(SessionModel, session_id)
+    assert stored.message_count == 4
+    assert stored.last_message_at is not None
+    assert stored.preview_image_url == "https://example.com/a.png"
+
+    statements = []
+
+    def record_statement(_conn, _cursor, statement, *_args):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record_statement)
+    try:
+        data = client.get("/api/sessions").json()
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record_statement)
+
+    assert data["sessions"][0]["message_count"] == 4
+    assert data["sessions"][0]["preview_image"] == "https://example.com/a.png"
+    assert not any("FROM messages" in statement for statement in statements)
+
+def test_sessions_list_falls_back_when_stored_preview_is_gone(test_db, monkeypatch, tmp_path):
+    """存储的预览图文件已删除时，列表改用会话中第一张仍存在的图片"""
+    monkeypatch.setattr(settings, "LOCAL_UPLOAD_DIR", str(tmp_path))
+    (tmp_path / "later.png").write_bytes(b"later")
+    session = SessionModel(id="stale-preview", preview_image_url="/uploads/first.png")
+    test_db.add(session)
+    test_db.add_all([
+        MessageModel(session_id=session.id, role="user", content="一", image_urls=["/uploads/first.png"],
+                     created_at=datetime(2026, 1, 1, 0, 0, 0)),
+        MessageModel(session_id=session.id, role="user", content="二", image_urls=["/uploads/later.png"],
+                     created_at=datetime(2026, 1, 1, 0, 0, 1)),
+    ])
+    test_db.commit()
+
+    data = client.get("/api/sessions").json()
+    assert data["sessions"][0]["preview_image"] == "/uploads/later.png"
+
+    # 逐轮只取各会话的下一条带图消息；图片全部失效或没有图片的会话返回 None
+    dead_only = SessionModel(id="dead-only")
+    test_db.add(dead_only)
+    test_db.add(MessageModel(session_id=dead_only.id, role="user", content="三", image_urls=["/uploads/gone.png"]))
+    test_db.add(SessionModel(id="no-images"))
+    test_db.commit()
+
+    async def load_previews():
+        async with AsyncSessionLocal() as db:
+            return await chat_service.ChatService.first_available_images(
+                db, ["stale-preview", "dead-only", "no-images"]
+            )
+
+    assert asyncio.run(load_previews()) == {
+        "stale-preview": "/uploads/later.png",
+        "dead-only": None,
+        "no-images": None,
+    }
+
+def test_warm_history_cache_skips_messages_select(test_db, monkeypatch):
+    """历史缓存命中时，后续轮次不再查询 messages 表"""
+    seen_histories = []
+
+    async def mock_stream(messages, **_kwargs):
+        seen_histories.append([msg["content"] for msg in messages])
+        yield "reply"
+
+    monkeypatch.setattr(chat_service.openai_service, "chat_completion_stream", mock_stream)
+
+    statements = []
+
+    def record_statement(_conn, _cursor, statement, *_args):
+        statements.append(statement)
+
+    cache = SessionHistoryCache(max_sessions=10)
+    service = chat_service.ChatService(history_cache=cache)
+
+    async def run_turn(session_id, message):
+        return [chunk async for chunk in service.process_chat(session_id, message)]
+
+    first = asyncio.run(run_turn(None, "first"))
+    session_id = first[0][len("session:"):]
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record_statement)
+    try:
+        asyncio.run(run_turn(session_id, "second"))
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record_statement)
+
+    assert seen_histories[-1] == ["first", "reply", "second"]
+    assert not any(
+        statement.lstrip().upper().startswith("SELECT") and "FROM messages" in statement
+        for statement in statements
+    )
+    # 新会话在创建时即填充缓存，两轮均命中
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 0
+
+    cache.invalidate()
+    assert cache.get(session_id) is None
+
+def test_clear_sessions_deletes_in_batches(test_db):
+    """清空对话按批集合式删除，逐批提交并报告进度"""
+    for index in range(5):
+        session = SessionModel(id=f"clear-{index}")
+        test_db.add(session)
+        test_db.add_all([
+            MessageModel(session_id=session.id, role="user", content=f"msg-{index}-{n}")
+            for n in range(4)
+        ])
+    # 动态与会话之间没有 relationship，先提交会话以满足外键
+    test_db.commit()
+    test_db.add(MomentModel(content="关联对话", session_id="clear-1"))
+    test_db.commit()
+    before = client.get("/api/moments")
+    assert before.json()["moments"][0]["session_id"] == "clear-1"
+
+    progress = []
+
+    async def run_clear():
+        async with AsyncSessionLocal() as db:
+            service = chat_service.ChatService(db)
+            return await service.clear_sessions(batch_size=2, message_batch_size=3, on_progress=progress.append)
+
+    result = asyncio.run(run_clear())
+    assert result == {"deleted_sessions": 5, "deleted_messages": 20, "detached_moments": 1}
+    assert [item["deleted_sessions"] for item in progress] == [2, 4, 5]
+    assert progress[-1] == result
+
+    test_db.expire_all()
+    assert test_db.query(SessionModel).count() == 0
+    assert test_db.query(MessageModel).count() == 0
+    assert test_db.query(MomentModel).one().session_id is None
+    # 解除关联后列表缓存与 ETag 同步刷新
+    after = client.get("/api/moments", headers={"If-None-Match": before.headers["etag"]})
+    assert after.status_code == 200
+    assert after.json()["moments"][0]["session_id"] is None
+
+    response = client.delete("/api/sessions")
+    assert response.json() == {"deleted_sessions": 0, "deleted_messages": 0, "detached_moments": 0}
+
+def test_truncate_messages_with_total_keeps_newest_within_budget():
+    """前缀和截断：保留最新消息、报告token总数且不修改原列表"""
+    messages = [
+        {"role": "user", "content": f"m{i}", "token_count": count}
+        for i, count in enumerate([40, 30, 20, 10])
+    ]
+    original = list(messages)
+
+    kept, total = token_counter.truncate_messages_with_total(messages, max_tokens=35, max_messages=10)
+    assert [msg["content"] for msg in kept] == ["m2", "m3"]
+    assert total == 30
+    assert messages == original
+
+    kept, total = token_counter.truncate_messages_with_total(messages, max_tokens=5, max_messages=10)
+    assert [msg["content"] for msg in kept] == ["m3"]
+    assert total == 10
+
+    kept, total = token_counter.truncate_messages_with_total(messages, max_tokens=1000, max_messages=2)
+    assert [msg["content"] for msg in kept] == ["m2", "m3"]
+    assert total == 30
+
+    assert token_counter.truncate_messages_with_total([], max_tokens=10) == ([], 0)
+
+def test_token_count_cache_lru_and_batch():
+    """token计数缓存：命中统计、按条目数淘汰及批量编码"""
+    counter = TokenCounter(cache=TokenCountCache(max_entries=2))
+
+    assert counter.count_tokens("hello world") == token_counter.count_tokens("hello world")
+    counter.count_tokens("hello world")
+    assert counter.cache_stats()["hits"] == 1
+    assert counter.cache_stats()["misses"] == 1
+
+    texts = ["hello world", "第二段文本", "third text"]
+    assert counter.count_tokens_batch(texts) == [token_counter.count_tokens(text) for text in texts]
+    stats = counter.cache_stats()
+    assert stats["entries"] == 2
+    assert stats["hits"] == 2
+    assert stats["misses"] == 3
+
+    # 字节上限按各条目实际大小累计
+    key = TokenCountCache.make_key("hello world")
+    entry_bytes = TokenCountCache.entry_size(key, 2)
+    assert stats["bytes"] == 2 * entry_bytes
+    byte_bound = TokenCountCache(max_entries=100, max_bytes=3 * entry_bytes)
+    for index in range(5):
+        byte_bound.put(TokenCountCache.make_key(f"text-{index}"), index)
+    assert byte_bound.stats()["entries"] == 3
+    assert byte_bound.get(TokenCountCache.make_key("text-0")) is None
+
+def test_token_counter_lazily_loads_local_encoding_file(tmp_path):
+    """编码延迟加载，并支持指向本地BPE文件（离线环境）"""
+    # 仅包含256个单字节token的最小BPE文件
+    bpe_file = tmp_path / "bytes.tiktoken"
+    bpe_file.write_text(
+        "\n".join(f"{base64.b64encode(bytes([i])).decode()} {i}" for i in range(256))
+    )
+
+    counter = TokenCounter(encoding_file=str(bpe_file))
+    assert counter.is_loaded is False
+
+    counter.warm_up_in_background().join(timeout=10)
+    assert counter.is_loaded is True
+    assert counter.count_tokens("abc") == 3
+
+def test_token_counter_does_not_block_event_loop_while_loading(tmp_path, monkeypatch):
+    """后台预热持有加载锁时，请求中的计数在线程中等待，事件循环仍可调度其它协程"""
+    bpe_file = tmp_path / "bytes.tiktoken"
+    bpe_file.write_text(
+        "\n".join(f"{base64.b64encode(bytes([i])).decode()} {i}" for i in range(256))
+    )
+    counter = TokenCounter(encoding_file=str(bpe_file))
+    release = threading.Event()
+    load_encoding = counter._load_encoding
+
+    def slow_load():
+        release.wait(timeout=10)
+        return load_encoding()
+
+    monkeypatch.setattr(counter, "_load_encoding", slow_load)
+    warm_up = counter.warm_up_in_background()
+
+    async def scenario():
+        count = asyncio.create_task(counter.run_async(counter.count_tokens, "abc"))
+        ticks = 0
+        for _ in range(5):
+            await asyncio.sleep(0.01)
+            ticks += 1
+        assert not count.done()
+        release.set()
+        return ticks, await count
+
+    assert asyncio.run(scenario()) == (5, 3)
+    warm_up.join(timeout=10)
+    assert counter.is_loaded is True
+
 def test_error_handling():
     """测试错误处理"""
     # 测试无效的JSON
@@ -228,6 +639,23 @@ def test_models():
     assert hasattr(message, 'audio_text')
     assert hasattr(message, 'created_at')
 
+def test_to_async_database_url_maps_drivers():
+    """测试同步数据库URL映射到异步驱动"""
+    assert to_async_database_url("sqlite:///./chat.db") == "sqlite+aiosqlite:///./chat.db"
+    assert to_async_database_url("postgres://u:p@host/db") == "postgresql+asyncpg://u:p@host/db"
+    assert to_async_database_url("postgresql+psycopg2://u:p@host/db") == "postgresql+asyncpg://u:p@host/db"
+
+def test_async_database_url_translates_sslmode_for_asyncpg():
+    """托管 Postgres 常带 ?sslmode=require：从 URL 移除并转为 asyncpg 的 ssl 参数，其余参数保留"""
+    url = "postgresql://u:p@host:5432/db?sslmode=require&application_name=chat"
+    assert to_async_database_url(url) == "postgresql+asyncpg://u:p@host:5432/db?application_name=chat"
+    assert async_connect_args(url) == {"ssl": "require"}
+    assert to_async_database_url("postgres://u:p@host/db?sslmode=verify-full") == "postgresql+asyncpg://u:p@host/db"
+    assert async_connect_args("postgres://u:p@host/db") == {}
+    assert async_connect_args("sqlite:///./chat.db?sslmode=require") == {}
+    with pytest.raises(ValueError):
+        async_connect_args("postgresql://u:p@host/db?sslmode=bogus")
+
 def test_file_service_extract_upload_result_supports_secure_url():
     """测试Cloudinary返回secure_url字段"""
     service = FileService()
@@ -279,6 +707,47 @@ def test_openai_service_prepare_image_url_for_local_upload(tmp_path, monkeypatch
     assert prepared_url.startswith("data:image/png;base64,")
 
 
+def test_openai_service_caches_local_image_data_urls(tmp_path, monkeypatch):
+    """本地图片data URL按(路径, mtime, 大小)缓存，文件变化后重新编码"""
+    monkeypatch.setattr(settings, "LOCAL_UPLOAD_DIR", str(tmp_path))
+    local_image = tmp_path / "images" / "cached.png"
+    local_image.parent.mkdir(parents=True, exist_ok=True)
+    local_image.write_bytes(b"\x89PNG\r\n\x1a\nfirst")
+    url = "/uploads/images/cached.png"
+
+    first = openai_service._prepare_image_url(url)
+    hits_before = openai_service.data_url_cache.hits
+    assert openai_service._prepare_image_urls([url, url]) == {url: first}
+    assert openai_service.data_url_cache.hits == hits_before + 1
+
+    local_image.write_bytes(b"\x89PNG\r\n\x1a\nsecond-version")
+    assert openai_service._prepare_image_url(url) != first
+
+
+def test_openai_service_uses_downscaled_prompt_variant(tmp_path, monkeypatch):
+    """本地大图送入模型前缩小并重新编码，变体缓存在原图旁"""
+    monkeypatch.setattr(settings, "LOCAL_UPLOAD_DIR", str(tmp_path))
+    local_image = tmp_path / "images" / "large.png"
+    local_image.parent.mkdir(parents=True, exist_ok=True)
+    Image.new("RGBA", (3000, 1500), (255, 0, 0, 128)).save(local_image)
+
+    prepared_url = openai_service._prepare_image_url("/uploads/images/large.png")
+    assert prepared_url.startswith("data:image/jpeg;base64,")
+
+    variant = image_variant_service.variant_path(local_image)
+    with Image.open(variant) as image:
+        assert image.format == "JPEG"
+        assert image.size == (1024, 512)
+    assert image_variant_service.get_prompt_image(local_image) == variant
+
+    # 原图未变时直接命中data URL缓存，不再检查变体
+    def fail_variant_lookup(_path):
+        raise AssertionError("variant lookup on cache hit")
+
+    monkeypatch.setattr(image_variant_service, "get_prompt_image", fail_variant_lookup)
+    assert openai_service._prepare_image_url("/uploads/images/large.png") == prepared_url
+
+
 def test_moments_workflow(test_db):
     """测试朋友圈动态发布、点赞和评论回复流程"""
     create_response = client.post(
@@ -366,6 +835,393 @@ def test_moments_workflow(test_db):
     assert all(item["id"] != moment_id for item in after_delete["moments"])
 
 
+def test_cursor_pagination_walks_sessions_and_moments(test_db):
+    """游标分页按 (时间, id) 倒序遍历，时间戳相同的行也不重复、不遗漏"""
+    same_time = datetime(2026, 1, 1, 12, 0, 0)
+    for index in range(5):
+        test_db.add(SessionModel(id=f"session-{index}", updated_at=same_time if index < 3 else datetime(2026, 1, index)))
+        test_db.add(MomentModel(id=f"moment-{index}", content=f"m{index}", created_at=same_time))
+    test_db.commit()
+
+    def walk(path, key):
+        seen, cursor = [], None
+        while True:
+            params = {"limit": 2}
+            if cursor:
+                params["cursor"] = cursor
+            data = client.get(path, params=params).json()
+            seen.extend(item["id"] for item in data[key])
+            cursor = data["next_cursor"]
+            if not cursor:
+                return seen
+
+    assert walk("/api/sessions", "sessions") == [
+        "session-4", "session-3", "session-2", "session-1", "session-0"
+    ]
+    assert walk("/api/moments", "moments") == [f"moment-{index}" for index in range(4, -1, -1)]
+
+    # page 形式仍可用，且同样给出下一页游标
+    first_page = client.get("/api/moments", params={"page": 1, "limit": 2}).json()
+    assert first_page["has_more"] is True
+    assert first_page["next_cursor"]
+
+    assert client.get("/api/sessions", params={"cursor": "not-a-cursor"}).status_code == 400
+    assert client.get("/api/moments", params={"cursor": "not-a-cursor"}).status_code == 400
+
+def test_list_totals_are_cached_and_optional(test_db):
+    """列表总数走短TTL缓存，写入路径失效；include_total=false 时不计数"""
+    for index in range(4):
+        client.post("/api/moments", json={"content": f"动态{index}"})
+
+    statements = []
+
+    def record_statement(_conn, _cursor, statement, *_args):
+        statements.append(statement)
+
+    # 冷缓存下 include_total=false 不应执行任何 COUNT(*)（ETag 不依赖总数）
+    list_count_cache.invalidate()
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record_statement)
+    try:
+        untotaled = client.get("/api/moments", params={"limit": 2, "include_total": "false"})
+        client.get("/api/moments", params={"limit": 2, "include_total": "false", "author": "你"})
+        client.get("/api/sessions", params={"include_total": "false"})
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record_statement)
+    assert untotaled.json()["total"] is None
+    assert not any(statement.lower().lstrip().startswith("select count(") for statement in statements)
+    # 发布与删除通过写入计数器刷新 ETag
+    created_id = client.post("/api/moments", json={"content": "计数器"}).json()["id"]
+    after_create = client.get("/api/moments", params={"limit": 2, "include_total": "false"})
+    assert after_create.headers["ETag"] != untotaled.headers["ETag"]
+    # 删除较旧的动态不改变 max(updated_at)，只能由计数器反映
+    oldest_id = client.get("/api/moments").json()["moments"][-1]["id"]
+    client.delete(f"/api/moments/{oldest_id}")
+    after_delete = client.get(
+        "/api/moments",
+        params={"limit": 2, "include_total": "false"},
+        headers={"If-None-Match": after_create.headers["ETag"]},
+    )
+    assert after_delete.status_code == 200
+    client.delete(f"/api/moments/{created_id}")
+
+    statements.clear()
+    list_count_cache.invalidate()
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record_statement)
+    try:
+        first = client.get("/api/moments", params={"limit": 2}).json()
+        second = client.get("/api/moments", params={"limit": 2, "include_total": "false"}).json()
+        third = client.get("/api/moments", params={"limit": 2}).json()
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record_statement)
+
+    assert first["total"] == 3 and first["has_more"] is True
+    assert second["total"] is None and second["has_more"] is True
+    assert third["total"] == 3
+    assert sum(statement.lower().lstrip().startswith("select count(") for statement in statements) == 1
+
+    moment_id = first["moments"][0]["id"]
+    client.delete(f"/api/moments/{moment_id}")
+    assert client.get("/api/moments").json()["total"] == 2
+
+    sessions = client.get("/api/sessions", params={"include_total": "false"}).json()
+    assert sessions["total"] is None
+    assert sessions["has_more"] is False
+
+    async def load_count():
+        return 7
+
+    expired = CountCache(ttl_seconds=0)
+    assert asyncio.run(expired.get_or_load("k", load_count)) == 7
+    assert asyncio.run(expired.get_or_load("k", load_count)) == 7
+    assert expired.stats()["misses"] == 2
+
+    # 按作者建键的条目受 LRU 上限约束
+    bounded = CountCache(ttl_seconds=60, max_entries=2)
+    for author in ("a", "b", "c"):
+        asyncio.run(bounded.get_or_load(f"moments:author:{author}", load_count))
+    assert bounded.stats()["keys"] == 2
+    asyncio.run(bounded.get_or_load("moments:author:a", load_count))
+    assert bounded.stats()["misses"] == 4
+
+def test_list_endpoints_answer_304_for_unchanged_etags(test_db, monkeypatch):
+    """版本标记未变时返回 304 且不加载行；点赞、评论、新消息都会刷新 ETag"""
+    async def mock_stream(_messages, **_kwargs):
+        yield "reply"
+
+    monkeypatch.setattr(chat_service.openai_service, "chat_completion_stream", mock_stream)
+    chat = client.post("/api/chat", json={"message": "你好", "session_id": None})
+    session_id = chat.text.split("session:", 1)[1].split("\n", 1)[0].strip()
+    moment_id = client.post("/api/moments", json={"content": "今天很开心"}).json()["id"]
+
+    urls = ["/api/moments", "/api/sessions", f"/api/sessions/{session_id}/messages"]
+    etags = {}
+    for url in urls:
+        response = client.get(url)
+        assert response.status_code == 200
+        etags[url] = response.headers["ETag"]
+        assert etags[url].startswith('W/"')
+
+    statements = []
+
+    def record_statement(_conn, _cursor, statement, *_args):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record_statement)
+    try:
+        for url in urls:
+            response = client.get(url, headers={"If-None-Match": etags[url]})
+            assert response.status_code == 304
+            assert response.headers["ETag"] == etags[url]
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record_statement)
+    assert not any("FROM moment_likes" in statement or "FROM messages" in statement for statement in statements)
+
+    # 不同查询参数对应不同 ETag
+    assert client.get("/api/moments", params={"me": "别人"}, headers={"If-None-Match": etags["/api/moments"]}).status_code == 200
+
+    client.post(f"/api/moments/{moment_id}/likes/toggle", json={"user_name": "你"})
+    assert client.get("/api/moments", headers={"If-None-Match": etags["/api/moments"]}).status_code == 200
+    liked_etag = client.get("/api/moments").headers["ETag"]
+    client.post(f"/api/moments/{moment_id}/comments", json={"content": "赞"})
+    assert client.get("/api/moments", headers={"If-None-Match": liked_etag}).status_code == 200
+
+    client.post("/api/chat", json={"message": "再聊聊", "session_id": session_id})
+    for url in urls[1:]:
+        assert client.get(url, headers={"If-None-Match": etags[url]}).status_code == 200
+
+def test_moments_feed_returns_previews_and_paginates_likes_and_comments(test_db, monkeypatch):
+    """列表只带点赞/评论预览与总数，完整列表通过游标分页接口获取"""
+    monkeypatch.setattr(settings, "MOMENT_FEED_LIKE_PREVIEW", 2)
+    monkeypatch.setattr(settings, "MOMENT_FEED_COMMENT_PREVIEW", 2)
+
+    # 直接写库时一并写入冗余计数
+    moment = MomentModel(id="popular", content="热门动态", like_count=4, comment_count=5)
+    test_db.add(moment)
+    test_db.add_all([
+        MomentLikeModel(moment_id=moment.id, user_name=name, created_at=datetime(2026, 1, 1, 0, 0, index))
+        for index, name in enumerate(["甲", "乙", "丙", "你"])
+    ])
+    test_db.add_all([
+        MomentCommentModel(
+            id=f"comment-{index}",
+            moment_id=moment.id,
+            user_name="甲",
+            content=f"评论{index}",
+            created_at=datetime(2026, 1, 1, 0, 1, index),
+        )
+        for index in range(5)
+    ])
+    test_db.commit()
+
+    feed = client.get("/api/moments").json()["moments"][0]
+    assert feed["like_count"] == 4
+    assert feed["likes"] == ["甲", "乙"]
+    assert feed["liked_by_me"] is True
+    assert feed["comment_count"] == 5
+    assert [comment["id"] for comment in feed["comments"]] == ["comment-3", "comment-4"]
+
+    likes_page = client.get(f"/api/moments/{moment.id}/likes", params={"limit": 3}).json()
+    assert likes_page["likes"] == ["甲", "乙", "丙"]
+    assert likes_page["has_more"] is True
+    rest = client.get(f"/api/moments/{moment.id}/likes", params={"cursor": likes_page["next_cursor"]}).json()
+    assert rest["likes"] == ["你"] and rest["has_more"] is False
+
+    earlier = client.get(
+        f"/api/moments/{moment.id}/comments", params={"order": "desc", "limit": 2}
+    ).json()
+    assert [comment["id"] for comment in earlier["comments"]] == ["comment-4", "comment-3"]
+    earlier = client.get(
+        f"/api/moments/{moment.id}/comments",
+        params={"order": "desc", "limit": 2, "cursor": earlier["next_cursor"]},
+    ).json()
+    assert [comment["id"] for comment in earlier["comments"]] == ["comment-2", "comment-1"]
+
+    forward = client.get(f"/api/moments/{moment.id}/comments", params={"limit": 10}).json()
+    assert [comment["id"] for comment in forward["comments"]] == [f"comment-{index}" for index in range(5)]
+
+    assert client.get("/api/moments/missing/comments").status_code == 404
+    assert client.get(f"/api/moments/{moment.id}/likes", params={"cursor": "bad"}).status_code == 400
+
+def test_moment_counters_are_maintained_and_checked(test_db):
+    """点赞/评论计数随写入原子维护；校对器发现并修复漂移"""
+    moment_id = client.post("/api/moments", json={"content": "计数"}).json()["id"]
+
+    liked = client.post(f"/api/moments/{moment_id}/likes/toggle", json={"user_name": "甲"}).json()
+    assert liked["like_count"] == 1
+    client.post(f"/api/moments/{moment_id}/likes/toggle", json={"user_name": "乙"})
+    unliked = client.post(f"/api/moments/{moment_id}/likes/toggle", json={"user_name": "甲"}).json()
+    assert unliked["liked"] is False and unliked["like_count"] == 1
+    client.post(f"/api/moments/{moment_id}/comments", json={"content": "第一条"})
+
+    stored = test_db.get(MomentModel, moment_id)
+    assert (stored.like_count, stored.comment_count) == (1, 1)
+
+    # 绕过接口直接写库制造漂移
+    test_db.add(MomentLikeModel(moment_id=moment_id, user_name="丙"))
+    drifted = MomentModel(content="漂移", comment_count=3)
+    test_db.add(drifted)
+    test_db.commit()
+
+    checker = MomentCounterChecker(session_factory=AsyncSessionLocal, batch_size=1)
+    report = asyncio.run(checker.check_once(repair=False))
+    assert report["checked"] == 2 and report["mismatched"] == 2 and report["repaired"] == 0
+
+    report = asyncio.run(checker.check_once())
+    assert report["repaired"] == 2
+    test_db.expire_all()
+    assert test_db.get(MomentModel, moment_id).like_count == 2
+    assert test_db.get(MomentModel, drifted.id).comment_count == 0
+    assert asyncio.run(checker.check_once())["mismatched"] == 0
+
+    feed = client.get("/api/moments").json()["moments"]
+    assert {item["id"]: item["like_count"] for item in feed}[moment_id] == 2
+
+def test_like_toggle_returns_bounded_preview_and_ignores_conflicts(test_db, monkeypatch):
+    """点赞切换返回计数与有限的点赞人预览；重复插入被 ON CONFLICT 忽略；不存在的动态不留下点赞行"""
+    monkeypatch.setattr(settings, "MOMENT_FEED_LIKE_PREVIEW", 2)
+    moment_id = client.post("/api/moments", json={"content": "点赞"}).json()["id"]
+
+    for name in ["甲", "乙", "丙"]:
+        result = client.post(f"/api/moments/{moment_id}/likes/toggle", json={"user_name": name}).json()
+    assert result == {"moment_id": moment_id, "liked": True, "like_count": 3, "likes": ["甲", "乙"]}
+
+    async def insert_twice():
+        async with AsyncSessionLocal() as db:
+            first = await db.scalar(moments_endpoint._insert_like_ignoring_conflict(db, moment_id, "丁"))
+            second = await db.scalar(moments_endpoint._insert_like_ignoring_conflict(db, moment_id, "丁"))
+            # 动态不存在时不插入（外键已在测试中开启），而不是抛出外键错误
+            orphan = await db.scalar(moments_endpoint._insert_like_ignoring_conflict(db, "missing", "丁"))
+            await db.rollback()
+            return first, second, orphan
+
+    first, second, orphan = asyncio.run(insert_twice())
+    assert first is not None and second is None and orphan is None
+
+    missing = client.post("/api/moments/missing/likes/toggle", json={"user_name": "甲"})
+    assert missing.status_code == 404
+    assert test_db.query(MomentLikeModel).filter_by(moment_id="missing").count() == 0
+
+def test_moments_feed_cache_serves_bytes_and_invalidates_on_writes(test_db):
+    """热点页命中缓存时不访问数据库；点赞只失效包含该动态的页，发布失效全部"""
+    assert feed_cache is not None
+    first_id = client.post("/api/moments", json={"content": "第一条"}).json()["id"]
+    second_id = client.post("/api/moments", json={"content": "第二条"}).json()["id"]
+
+    page_one = client.get("/api/moments", params={"limit": 1}).json()
+    page_two = client.get("/api/moments", params={"limit": 1, "cursor": page_one["next_cursor"]}).json()
+    assert [page_one["moments"][0]["id"], page_two["moments"][0]["id"]] == [second_id, first_id]
+
+    statements = []
+
+    def record_statement(_conn, _cursor, statement, *_args):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record_statement)
+    try:
+        cached = client.get("/api/moments", params={"limit": 1})
+        revalidated = client.get(
+            "/api/moments", params={"limit": 1}, headers={"If-None-Match": cached.headers["ETag"]}
+        )
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record_statement)
+    assert statements == []
+    assert cached.json() == page_one
+    assert revalidated.status_code == 304
+
+    # 点赞第二页的动态：第一页仍命中缓存，第二页重新生成
+    hits_before = feed_cache.hits
+    client.post(f"/api/moments/{first_id}/likes/toggle", json={"user_name": "你"})
+    client.get("/api/moments", params={"limit": 1})
+    assert feed_cache.hits == hits_before + 1
+    refreshed = client.get("/api/moments", params={"limit": 1, "cursor": page_one["next_cursor"]}).json()
+    assert refreshed["moments"][0]["like_count"] == 1
+    assert refreshed["moments"][0]["liked_by_me"] is True
+
+    client.post("/api/moments", json={"content": "第三条"})
+    assert client.get("/api/moments", params={"limit": 1}).json()["moments"][0]["content"] == "第三条"
+
+    # 写入期间生成的响应不回填缓存
+    local_cache = FeedCache(InProcessFeedBackend(max_bytes=1024), ttl_seconds=60)
+    snapshot = asyncio.run(local_cache.snapshot())
+    asyncio.run(local_cache.invalidate_moment("m"))
+    asyncio.run(local_cache.put("k", b"{}", 'W/"x"', ["m"], snapshot))
+    assert asyncio.run(local_cache.get("k")) is None
+
+def test_author_timeline_filters_and_paginates_by_cursor(test_db):
+    """author 参数返回个人时间线：只含该作者的动态，游标翻页，总数按作者统计并随发布失效"""
+    for index in range(3):
+        client.post("/api/moments", json={"content": f"我的{index}"})
+        client.post("/api/moments", json={"content": f"甲的{index}", "author_name": "甲"})
+
+    first = client.get("/api/moments", params={"author": "甲", "limit": 2}).json()
+    assert [item["content"] for item in first["moments"]] == ["甲的2", "甲的1"]
+    assert first["total"] == 3 and first["has_more"] is True
+    rest = client.get(
+        "/api/moments", params={"author": "甲", "limit": 2, "cursor": first["next_cursor"]}
+    ).json()
+    assert [item["content"] for item in rest["moments"]] == ["甲的0"]
+    assert rest["has_more"] is False
+
+    # 全部动态与个人时间线的缓存键、总数互不干扰
+    assert client.get("/api/moments").json()["total"] == 6
+    client.post("/api/moments", json={"content": "甲的3", "author_name": "甲"})
+    assert client.get("/api/moments", params={"author": " 甲 "}).json()["total"] == 4
+    assert client.get("/api/moments", params={"author": ""}).json()["total"] == 7
+    assert client.get("/api/moments", params={"author": "乙"}).json()["moments"] == []
+
+def test_list_endpoints_bypass_response_model_but_match_schemas(test_db, monkeypatch):
+    """列表接口用 orjson 直接编码 dict、不经 response_model 再校验，输出仍须符合声明的模型"""
+    moment_id = client.post("/api/moments", json={"content": "序列化", "image_urls": []}).json()["id"]
+    client.post(f"/api/moments/{moment_id}/likes/toggle", json={"user_name": "甲"})
+    client.post(f"/api/moments/{moment_id}/comments", json={"content": "评论"})
+    test_db.add(SessionModel(id="serialize-session", title="会话"))
+    test_db.commit()
+
+    for cache in (feed_cache, None):
+        monkeypatch.setattr(moments_endpoint, "feed_cache", cache)
+        feed = client.get("/api/moments", params={"limit": 1})
+        assert feed.headers["content-type"] == "application/json"
+        assert "ETag" in feed.headers
+        parsed = MomentsListResponse.model_validate_json(feed.content)
+        assert parsed.moments[0].comments[0].content == "评论"
+        assert parsed.moments[0].likes == ["甲"]
+
+    comments = client.get(f"/api/moments/{moment_id}/comments")
+    MomentCommentsPageResponse.model_validate_json(comments.content)
+    likes = client.get(f"/api/moments/{moment_id}/likes")
+    MomentLikesPageResponse.model_validate_json(likes.content)
+
+    sessions = client.get("/api/sessions")
+    assert "ETag" in sessions.headers
+    assert SessionsResponse.model_validate_json(sessions.content).sessions[0].id == "serialize-session"
+
+def test_feed_cache_reverse_index_is_bounded_by_entries():
+    """反向索引随条目淘汰、过期、失效同步收缩，不会因大量不同的缓存键无限增长"""
+    backend = InProcessFeedBackend(max_bytes=1024)
+    body = b"x" * 200
+
+    async def scenario():
+        for index in range(50):
+            await backend.put(f"page-{index}", body, 'W/"e"', [f"m{index}", "shared"], ttl_seconds=60)
+        full = backend.stats()
+        # 每条约 456 字节，1024 字节只容纳 2 条：索引只剩这 2 页的动态与 shared
+        assert full["entries"] == 2
+        assert full["indexed_moments"] == 3
+
+        await backend.invalidate_moment("m49")
+        assert backend.stats()["indexed_moments"] == 2
+        assert await backend.get("page-48") is not None
+
+        await backend.put("expiring", body, 'W/"e"', ["m-exp"], ttl_seconds=0)
+        assert await backend.get("expiring") is None
+        assert "m-exp" not in backend._keys_by_moment
+
+        # 覆盖同一个键时旧页的动态不再留在索引中
+        await backend.put("page-48", body, 'W/"e"', ["m-new"], ttl_seconds=60)
+        assert "m48" not in backend._keys_by_moment and "shared" not in backend._keys_by_moment
+
+    asyncio.run(scenario())
+
 def test_moments_endpoint_filters_missing_local_media(test_db, monkeypatch, tmp_path):
     """本地上传URL若文件不存在，应从返回中剔除，避免前端出现坏图"""
     monkeypatch.setattr(settings, "LOCAL_UPLOAD_DIR", str(tmp_path))
@@ -385,6 +1241,122 @@ def test_moments_endpoint_filters_missing_local_media(test_db, monkeypatch, tmp_
     assert item["author_avatar_url"] is None
     assert item["image_urls"] == ["https://example.com/ok.png"]
 
+def test_media_resolver_indexes_uploads_and_caches_misses(tmp_path, monkeypatch):
+    """媒体解析器：目录扫描建索引、上传登记、负缓存，并拒绝越界路径"""
+    monkeypatch.setattr(settings, "LOCAL_UPLOAD_DIR", str(tmp_path))
+    resolver = MediaResolver(negative_ttl_seconds=60)
+    (tmp_path / "images").mkdir()
+    (tmp_path / "images" / "seed.png").write_bytes(b"seed")
+
+    assert resolver.rescan() == 1
+    assert resolver.exists("https://example.com/uploads/images/seed.png") is True
+    assert resolver.exists("https://example.com/a.png") is None
+    assert resolver.exists("/uploads/../secret.txt") is False
+
+    # 负缓存期内即使文件出现也视为不存在，登记后立即可见
+    assert resolver.exists("/uploads/images/late.png") is False
+    (tmp_path / "images" / "late.png").write_bytes(b"late")
+    assert resolver.exists("/uploads/images/late.png") is False
+    resolver.register("images/late.png")
+    assert resolver.sanitize_image_urls([" /uploads/images/late.png ", "", "/uploads/images/gone.png"]) == [
+        "/uploads/images/late.png"
+    ]
+    assert resolver.resolve_path("/uploads/images/seed.png") == tmp_path.resolve() / "images" / "seed.png"
+
+def test_media_resolver_notices_files_deleted_at_runtime(tmp_path, monkeypatch):
+    """运行期间被删除的文件：存在结果过期后重新检查文件系统；forget 立即生效"""
+    monkeypatch.setattr(settings, "LOCAL_UPLOAD_DIR", str(tmp_path))
+    (tmp_path / "a.png").write_bytes(b"a")
+    (tmp_path / "b.png").write_bytes(b"b")
+
+    expiring = MediaResolver(negative_ttl_seconds=60, positive_ttl_seconds=0)
+    expiring.rescan()
+    (tmp_path / "a.png").unlink()
+    assert expiring.exists("/uploads/a.png") is False
+
+    cached = MediaResolver(negative_ttl_seconds=60, positive_ttl_seconds=60)
+    cached.rescan()
+    (tmp_path / "b.png").unlink()
+    # TTL 内仍视为存在，显式 forget 后立即重新检查
+    assert cached.exists("/uploads/b.png") is True
+    cached.forget("b.png")
+    assert cached.exists("/uploads/b.png") is False
+
+def test_media_reconciler_repairs_dead_local_references(test_db, monkeypatch, tmp_path):
+    """后台修复任务清理失效的本地上传引用，朋友圈列表保持只读"""
+    monkeypatch.setattr(settings, "LOCAL_UPLOAD_DIR", str(tmp_path))
+    (tmp_path / "images").mkdir()
+    (tmp_path / "images" / "alive.png").write_bytes(b"alive")
+
+    (tmp_path / "images" / "later.png").write_bytes(b"later")
+
+    session = SessionModel(preview_image_url="/uploads/images/dead.png", updated_at=datetime(2026, 1, 1))
+    test_db.add(session)
+    test_db.commit()
+    moment = MomentModel(
+        author_name="你",
+        author_avatar_url="/uploads/images/dead-avatar.png",
+        content="修复测试",
+        image_urls=["/uploads/images/alive.png", "/uploads/images/dead.png"],
+    )
+    message = MessageModel(
+        session_id=session.id,
+        role="user",
+        content="看图",
+        image_urls=["/uploads/images/dead.png"],
+        created_at=datetime(2026, 1, 1, 0, 0, 0),
+    )
+    later_message = MessageModel(
+        session_id=session.id,
+        role="user",
+        content="再看一张",
+        image_urls=["/uploads/images/later.png"],
+        created_at=datetime(2026, 1, 1, 0, 0, 1),
+    )
+    dead_file = FileModel(public_id="local/images/dead.png", url="/uploads/images/dead.png", format="png", size=4)
+    test_db.add_all([moment, message, later_message, dead_file])
+    test_db.commit()
+    dead_file_id = dead_file.id
+
+    # GET 不再写库
+    client.get("/api/moments")
+    test_db.refresh(moment)
+    assert moment.author_avatar_url == "/uploads/images/dead-avatar.png"
+
+    report = asyncio.run(MediaReconciler(batch_size=1).reconcile_once())
+    assert report["moments_repaired"] == 1
+    assert report["messages_repaired"] == 1
+    assert report["sessions_repaired"] == 1
+    # 默认只上报缺失的文件记录，不删除
+    assert (report["files_missing"], report["files_removed"]) == (1, 0)
+
+    test_db.expire_all()
+    assert test_db.get(MomentModel, moment.id).author_avatar_url is None
+    assert test_db.get(MomentModel, moment.id).image_urls == ["/uploads/images/alive.png"]
+    assert test_db.get(MessageModel, message.id).image_urls is None
+    repaired_session = test_db.get(SessionModel, session.id)
+    assert repaired_session.preview_image_url == "/uploads/images/later.png"
+    assert repaired_session.updated_at == datetime(2026, 1, 1)
+    assert test_db.get(FileModel, dead_file_id) is not None
+
+    report = asyncio.run(MediaReconciler(delete_missing_files=True).reconcile_once())
+    assert (report["files_missing"], report["files_removed"]) == (1, 1)
+    test_db.expire_all()
+    assert test_db.get(FileModel, dead_file_id) is None
+
+    # 上传目录不可用（未挂载或为空）时整轮跳过，不改写任何引用
+    for upload_dir in (tmp_path / "unmounted", tmp_path / "empty"):
+        if upload_dir.name == "empty":
+            upload_dir.mkdir()
+        monkeypatch.setattr(settings, "LOCAL_UPLOAD_DIR", str(upload_dir))
+        report = asyncio.run(MediaReconciler().reconcile_once())
+        assert report["skipped"] in ("upload_root_missing", "upload_root_empty")
+        assert report["moments_repaired"] == report["messages_repaired"] == report["sessions_repaired"] == 0
+        test_db.expire_all()
+        assert test_db.get(MomentModel, moment.id).image_urls == ["/uploads/images/alive.png"]
+        assert test_db.get(MessageModel, later_message.id).image_urls == ["/uploads/images/later.png"]
+        assert test_db.get(SessionModel, session.id).preview_image_url == "/uploads/images/later.png"
+
 # 创建配置文件
 # tests/conftest.py
 from unittest.mock import AsyncMock, Mock
@@ -59,7 +59,7 @@ def test_e2e_api_key_authentication(test_db):
 @patch("app.services.chat_service.openai_service.chat_completion_stream")
 def test_e2e_chat_workflow(mock_chat_stream, test_db):
     """端到端测试3: 完整聊天工作流程"""
-    async def mock_stream(_messages):
+    async def mock_stream(_messages, **_kwargs):
         yield "Hello! I'm an AI assistant."
 
     mock_chat_stream.side_effect = mock_stream
@@ -136,7 +136,7 @@ def test_e2e_file_upload_workflow(mock_cloudinary, test_db):
     }
 
     # 模拟OpenAI响应（需要额外的mock，简化测试）
-    async def mock_stream(_messages):
+    async def mock_stream(_messages, **_kwargs):
         yield "I see an image."
 
     with patch("app.services.chat_service.openai_service.chat_completion_stream", side_effect=mock_stream):
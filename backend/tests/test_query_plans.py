@@ -0,0 +1,121 @@
+"""
+查询计划测试 - 验证热点查询命中预期索引（SQLite / Postgres）
+"""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import select, text, update
+from sqlalchemy.dialects import postgresql
+from app.core.database import Base, engine
+from app.api.endpoints.moments import _feed_query, _liked_by_me_query, _toggle_like_statement
+from app.models.moment import Moment, MomentComment
+from app.services.chat_service import ChatService
+from app.utils.pagination import encode_cursor
+
+
+@pytest.fixture(scope="function")
+def plan_db():
+    Base.metadata.create_all(bind=engine)
+    with engine.connect() as connection:
+        if engine.dialect.name == "postgresql":
+            # 测试数据量很小，关闭顺序扫描以暴露索引是否可用
+            connection.execute(text("SET enable_seqscan = off"))
+        yield connection
+    Base.metadata.drop_all(bind=engine)
+
+
+def _explain(connection, statement) -> str:
+    compiled = statement.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True})
+    if engine.dialect.name == "sqlite":
+        rows = connection.execute(text(f"EXPLAIN QUERY PLAN {compiled}")).all()
+        return "\n".join(str(row[-1]) for row in rows)
+    if engine.dialect.name == "postgresql":
+        rows = connection.execute(text(f"EXPLAIN {compiled}")).all()
+        return "\n".join(str(row[0]) for row in rows)
+    pytest.skip(f"不支持的数据库方言: {engine.dialect.name}")
+
+
+def _assert_keyset_range(plan: str) -> None:
+    """游标条件应作为索引上的范围条件使用，而不是边扫描边过滤"""
+    if engine.dialect.name == "sqlite":
+        assert ")<(" in plan.replace(" ", "")
+    else:
+        assert "Index Cond" in plan and "Filter" not in plan
+
+
+def test_session_history_query_uses_composite_index(plan_db):
+    """会话历史查询应使用 (session_id, created_at) 复合索引"""
+    plan = _explain(plan_db, ChatService._history_query("session-id", 30))
+    assert "ix_messages_session_id_created_at" in plan
+    # 索引已按 created_at 有序，不应出现额外排序
+    assert "TEMP B-TREE" not in plan
+
+
+def test_sessions_keyset_query_uses_composite_index(plan_db):
+    """会话游标分页应沿 (updated_at, id) 索引定位，无需排序"""
+    cursor = encode_cursor(datetime(2026, 1, 1), "session-id")
+    plan = _explain(plan_db, ChatService._sessions_query(21, cursor=cursor))
+    assert "ix_sessions_updated_at_id" in plan
+    assert "TEMP B-TREE" not in plan
+    _assert_keyset_range(plan)
+
+
+def test_moments_keyset_query_uses_composite_index(plan_db):
+    """朋友圈游标分页应沿 (created_at, id) 索引定位，无需排序"""
+    cursor = encode_cursor(datetime(2026, 1, 1), "moment-id")
+    plan = _explain(plan_db, _feed_query(cursor).limit(21))
+    assert "ix_moments_created_at_id" in plan
+    assert "TEMP B-TREE" not in plan
+    _assert_keyset_range(plan)
+
+
+def test_author_timeline_query_uses_author_index(plan_db):
+    """个人时间线游标分页应沿 (author_name, created_at, id) 索引读取，无需排序"""
+    cursor = encode_cursor(datetime(2026, 1, 1), "moment-id")
+    plan = _explain(plan_db, _feed_query(cursor, author="你").limit(21))
+    assert "ix_moments_author_name_created_at" in plan
+    assert "TEMP B-TREE" not in plan
+    _assert_keyset_range(plan)
+
+
+def test_moment_bulk_updates_use_author_and_session_indexes(plan_db):
+    """按作者批量改头像、按会话解除关联都应走索引而非全表扫描"""
+    avatar_plan = _explain(
+        plan_db, update(Moment).where(Moment.author_name == "你").values(author_avatar_url="/a.png")
+    )
+    assert "ix_moments_author_name_created_at" in avatar_plan
+    detach_plan = _explain(
+        plan_db, update(Moment).where(Moment.session_id.in_(["s1", "s2"])).values(session_id=None)
+    )
+    assert "ix_moments_session_id" in detach_plan
+
+
+def test_moment_comments_page_uses_moment_created_index(plan_db):
+    """单条动态的评论分页应沿 (moment_id, created_at) 索引读取"""
+    statement = (
+        select(MomentComment)
+        .where(MomentComment.moment_id == "moment-id")
+        .order_by(MomentComment.created_at.desc())
+        .limit(21)
+    )
+    plan = _explain(plan_db, statement)
+    assert "ix_moment_comments_moment_id_created_at" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_liked_by_me_query_uses_user_index(plan_db):
+    """整页 liked_by_me 判断应走 (user_name, moment_id) 索引"""
+    plan = _explain(plan_db, _liked_by_me_query([f"moment-{index}" for index in range(20)], "你"))
+    assert "ix_moment_likes_user_name_moment_id" in plan
+
+
+def test_toggle_like_is_single_statement_on_postgres():
+    """PostgreSQL 点赞切换为一条数据修改CTE：删除、条件插入、计数更新一次往返完成"""
+    compiled = _toggle_like_statement("moment-1", "你").compile(dialect=postgresql.dialect())
+    sql = " ".join(str(compiled).split())
+    assert sql.startswith("WITH deleted AS (DELETE FROM moment_likes")
+    assert "inserted AS (INSERT INTO moment_likes (id, moment_id, user_name, created_at)" in sql
+    assert "ON CONFLICT ON CONSTRAINT uq_moment_like_user DO NOTHING" in sql
+    assert "bumped AS (UPDATE moments SET like_count=" in sql
+    # 嵌套 INSERT 不预取默认值，所有参数必须在语句中给出
+    assert all(value is not None for value in compiled.params.values())